@@ -0,0 +1,43 @@
+ROLE_VIEWER = 'viewer'
+ROLE_ADMIN = 'admin'
+
+# Чем больше число, тем больше прав
+ROLE_LEVELS = {
+    ROLE_VIEWER: 1,
+    ROLE_ADMIN: 2,
+}
+
+
+def parse_admins(value):
+    """Разбирает строку вида `111:admin, 222:viewer` в словарь chat_id -> роль"""
+    roles = {}
+    for item in value.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        chat_id, _, role = item.partition(':')
+        role = role.strip().lower() or ROLE_ADMIN
+        if role not in ROLE_LEVELS:
+            raise ValueError(f"неизвестная роль {role} для chat_id {chat_id}")
+        roles[int(chat_id.strip())] = role
+    return roles
+
+
+class AccessControl:
+    """Список авторизованных чатов и их ролей"""
+
+    def __init__(self, chat_id, admins=None):
+        self.roles = {int(chat_id): ROLE_ADMIN}
+        if admins:
+            self.roles.update(admins)
+
+    @property
+    def chat_ids(self):
+        return list(self.roles)
+
+    def role(self, chat_id):
+        return self.roles.get(int(chat_id))
+
+    def allows(self, chat_id, role=ROLE_VIEWER):
+        current = self.role(chat_id)
+        return current is not None and ROLE_LEVELS[current] >= ROLE_LEVELS[role]
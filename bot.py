@@ -1,3 +1,4 @@
+import asyncio
 import logging
 import os
 import glob
@@ -5,9 +6,28 @@ import subprocess
 from datetime import datetime
 import time
 import threading
-from telegram import Update, ReplyKeyboardMarkup
-from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, ContextTypes, filters
+from telegram import (Update, ReplyKeyboardMarkup, InlineKeyboardButton, InlineKeyboardMarkup,
+                      InlineQueryResultArticle, InputTextMessageContent)
+from telegram.ext import (Application, CommandHandler, MessageHandler, CallbackQueryHandler, InlineQueryHandler,
+                          ContextTypes, filters)
 from telegram.constants import ParseMode
+from access import ROLE_ADMIN, ROLE_VIEWER, AccessControl
+from config_store import DEFAULT_REVISIONS_PATH, ConfigStore
+from dashboard import DEFAULT_DASHBOARD_PATH, Dashboard
+from drift import WG_INTERFACE, DriftDetector
+from history import DEFAULT_HISTORY_PATH, SessionHistory
+from metrics import DEFAULT_METRICS_ADDR, MetricsExporter
+import export
+import geoip
+from geoip import GeoIP
+import perf
+from search_index import ClientIndex
+import html
+import views
+import webhook
+from snapshot_cache import DEFAULT_TTL, SnapshotCache
+from traffic_accounting import DEFAULT_TRAFFIC_PATH, TrafficAccounting
+from wg_show import WG_DUMP_COMMAND, WgSnapshot, parse_wg_dump, parse_wg0_names
 
 # Настройка логирования
 logging.basicConfig(
@@ -16,49 +36,127 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+WG0_CONF_PATH = '/etc/wireguard/wg0.conf'
+CLIENTS_DIR = '/etc/wireguard/clients'
+# Применение wg0.conf к интерфейсу без перезапуска (сессии остальных пиров сохраняются)
+SYNCCONF_COMMAND = "wg syncconf wg0 <(wg-quick strip wg0)"
+# Сколько секунд бот ждёт имя клиента после нажатия «Удалить клиента»
+CONVERSATION_TIMEOUT = 120
+# Сколько поток мониторинга ждёт отправки сообщения через цикл приложения (секунды)
+MONITOR_SEND_TIMEOUT = 120
+
 MENU_BUTTONS = [
     ["📊 Статус WireGuard", "👥 Список клиентов"],
     ["🗑 Удалить клиента"]
 ]
+MENU_TEXTS = {text for row in MENU_BUTTONS for text in row}
 
 class WireGuardBot:
-    def __init__(self, bot_token, chat_id):
+    def __init__(self, bot_token, chat_id, metrics_port=None, metrics_addr=DEFAULT_METRICS_ADDR, prefetch=None,
+                 snapshot_ttl=DEFAULT_TTL, history_path=DEFAULT_HISTORY_PATH,
+                 traffic_path=DEFAULT_TRAFFIC_PATH, admins=None, webhook_config=None, api_url=None,
+                 dashboard_path=DEFAULT_DASHBOARD_PATH, geoip_path=None, geoip_asn_path=None,
+                 revisions_path=DEFAULT_REVISIONS_PATH):
         self.bot_token = bot_token
         self.chat_id = chat_id
-        self.delete_client_mode = False
-        self.application = Application.builder().token(self.bot_token).build()
+        self.access = AccessControl(chat_id, admins)
+        # chat_id -> момент, до которого ждём имя удаляемого клиента
+        self.pending_delete = {}
+        # wg0.conf и интерфейс — общий ресурс: изменения выполняются по одному
+        self.wg_lock = asyncio.Lock()
+        # Цикл событий приложения: поток мониторинга отправляет сообщения через него
+        self.app_loop = None
+        self.app_ready = threading.Event()
+        builder = Application.builder().token(self.bot_token).request(perf.timed_telegram_request()).concurrent_updates(True)
+        builder = builder.post_init(self.post_init)
+        if api_url:
+            builder = builder.base_url(f"{api_url}/bot").base_file_url(f"{api_url}/file/bot")
+        self.application = builder.build()
+        self.webhook_config = webhook_config
+        self.prefetch = prefetch
+        self.snapshots = SnapshotCache(self.fetch_snapshot, snapshot_ttl)
+        self.history = SessionHistory(history_path)
+        self.accounting = TrafficAccounting(traffic_path)
+        self.dashboard = Dashboard(dashboard_path)
+        self.search_index = ClientIndex()
+        self.drift = DriftDetector()
+        self.geoip = GeoIP(geoip_path, geoip_asn_path)
+        self.config_store = ConfigStore(revisions_path)
+        self.metrics = MetricsExporter()
+        if metrics_port:
+            self.metrics.start(metrics_port, metrics_addr)
         threading.Thread(target=self.monitoring_loop, args=(self.application.bot,), daemon=True).start()
 
+    def checkpoint_traffic(self):
+        """Учитывает трафик перед перезапуском интерфейса, который обнулит счётчики.
+
+        Возвращает ключи пиров интерфейса, чьи базы нужно обнулить после
+        перезапуска (пусто, если учесть трафик не удалось).
+        """
+        try:
+            snapshot = self.snapshots.get_fresh(max_age=0)
+            self.accounting.record_snapshot(snapshot)
+        except Exception as e:
+            logger.error(f"Ошибка учёта трафика перед перезапуском: {e}")
+            return []
+        return [pubkey for pubkey, peer in snapshot.by_key.items() if peer.get('interface') == WG_INTERFACE]
+
+    def reset_traffic_baselines(self, pubkeys):
+        """Обнуляет базы учёта трафика пиров перезапущенного интерфейса"""
+        try:
+            self.accounting.reset_baselines(pubkeys)
+        except Exception as e:
+            logger.error(f"Ошибка сброса базы учёта трафика: {e}")
+
+    def take_prefetch(self):
+        """Забирает результат предзагрузки снимка, запущенной в run_bot.py до импорта telegram"""
+        prefetch = self.prefetch
+        if prefetch is None:
+            return
+        try:
+            result = prefetch.result()
+        except Exception as e:
+            logger.error(f"Ошибка предзагрузки снимка wg: {e}")
+            self.prefetch = None
+            return
+        self.snapshots.seed(result['snapshot'])
+        self.prefetch = None
+
+    def fetch_snapshot(self):
+        """Снимает `wg show all dump` и читает wg0.conf (вызывается только через кэш снимков)"""
+        with perf.span('snapshot.fetch'):
+            result = self.run_subprocess(WG_DUMP_COMMAND.split())
+            rows = list(parse_wg_dump(result.stdout.splitlines()))
+            if not rows:
+                raise RuntimeError(f"пустой вывод wg show all dump: {result.stderr.strip()}")
+            return WgSnapshot(rows, self.read_file(WG0_CONF_PATH))
+
+    def get_snapshot(self, fresh=False):
+        """Возвращает общий снимок WireGuard; fresh=True дожидается данных не старше TTL"""
+        self.take_prefetch()
+        if fresh:
+            return self.snapshots.get_fresh()
+        return self.snapshots.get()
+
     def get_wg_configs(self):
         try:
-            result = subprocess.run(["wg", "show"], capture_output=True, text=True)
-            output = result.stdout
-            configs = []
-            current_peer = None
-            for line in output.split('\n'):
-                if line.startswith('peer:'):
-                    if current_peer:
-                        configs.append(current_peer)
-                    current_peer = {'peer': line.split(':')[1].strip()}
-                elif current_peer and line.strip():
-                    if ':' in line:
-                        key, value = line.split(':', 1)
-                        current_peer[key.strip()] = value.strip()
-            if current_peer:
-                configs.append(current_peer)
-            return configs
+            return self.get_snapshot().peers
         except Exception as e:
             logger.error(f"Ошибка получения конфигов wg: {e}")
             return []
 
     def get_wg_interface_status(self):
         try:
-            result = subprocess.run(["wg", "show"], capture_output=True, text=True)
+            result = self.run_subprocess(["wg", "show"])
             return result.stdout
         except Exception as e:
             logger.error(f"Ошибка получения статуса wg: {e}")
             return None
 
+    def run_subprocess(self, args):
+        with perf.span('subprocess.run', ' '.join(args)):
+            return subprocess.run(args, capture_output=True, text=True)
+
     def read_file(self, path):
         try:
             with open(path, 'r') as f:
@@ -67,17 +165,74 @@ class WireGuardBot:
             logger.error(f"Ошибка чтения файла {path}: {e}")
             return None
 
+    def collect_config_files(self):
+        """Текущие wg0.conf и файлы клиентов {путь: bytes}"""
+        files = {}
+        with open(WG0_CONF_PATH, 'rb') as f:
+            files[WG0_CONF_PATH] = f.read()
+        for path in glob.glob(os.path.join(CLIENTS_DIR, '*.conf')):
+            with open(path, 'rb') as f:
+                files[path] = f.read()
+        return files
+
+    def save_revision(self, reason):
+        """Сохраняет ревизию wg0.conf и файлов клиентов; возвращает её номер или None, если сохранить не удалось"""
+        try:
+            revision_id, created = self.config_store.commit(self.collect_config_files(), reason)
+            if created:
+                logger.info(f"Сохранена ревизия конфигурации #{revision_id}: {reason}")
+            return revision_id
+        except Exception as e:
+            logger.error(f"Не удалось сохранить ревизию конфигурации: {e}")
+            return None
+
+    def check_revision_paths(self, files):
+        for path in files:
+            if path != WG0_CONF_PATH and not (os.path.dirname(path) == CLIENTS_DIR and path.endswith('.conf')):
+                raise ValueError(f"недопустимый путь в ревизии: {path}")
+
+    def apply_revision(self, files):
+        """Записывает файлы ревизии и применяет wg0.conf через `wg syncconf`; возвращает текст ошибки или None"""
+        self.check_revision_paths(files)
+        for path in glob.glob(os.path.join(CLIENTS_DIR, '*.conf')):
+            if path not in files:
+                os.remove(path)
+        os.makedirs(CLIENTS_DIR, exist_ok=True)
+        for path, data in files.items():
+            tmp_path = f"{path}.rollback"
+            with open(os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        return self.sync_wireguard()
+
+    def sync_wireguard(self):
+        """Приводит интерфейс к wg0.conf без перезапуска; возвращает текст ошибки или None"""
+        result = self.run_subprocess(["bash", "-c", SYNCCONF_COMMAND])
+        if result.returncode != 0:
+            return result.stderr.strip() or f"wg syncconf завершился с кодом {result.returncode}"
+        return None
+
+    def remove_client_files(self, names):
+        for name in names:
+            try:
+                os.remove(os.path.join(CLIENTS_DIR, f"{name}.conf"))
+            except FileNotFoundError:
+                pass
+
     def restart_wireguard(self):
         """Перезапускает WireGuard интерфейс"""
+        checkpointed = self.checkpoint_traffic()
         try:
             # Останавливаем интерфейс
-            result = subprocess.run(["wg-quick", "down", "wg0"], capture_output=True, text=True)
+            result = self.run_subprocess(["wg-quick", "down", "wg0"])
             if result.returncode != 0:
                 logger.error(f"Ошибка остановки wg0: {result.stderr}")
                 return False
+            # Счётчики обнулены: прирост после запуска считаем от нуля
+            self.reset_traffic_baselines(checkpointed)
             
             # Запускаем интерфейс
-            result = subprocess.run(["wg-quick", "up", "wg0"], capture_output=True, text=True)
+            result = self.run_subprocess(["wg-quick", "up", "wg0"])
             if result.returncode != 0:
                 logger.error(f"Ошибка запуска wg0: {result.stderr}")
                 return False
@@ -88,9 +243,19 @@ class WireGuardBot:
             logger.error(f"Ошибка перезапуска WireGuard: {e}")
             return False
 
+    async def check_access(self, update, role=ROLE_VIEWER):
+        """Проверяет, что чат авторизован и его роль не ниже требуемой"""
+        chat_id = update.effective_chat.id
+        if self.access.allows(chat_id, role):
+            return True
+        if self.access.role(chat_id) is None:
+            await update.effective_message.reply_text("У вас нет доступа к этому боту.")
+        else:
+            await update.effective_message.reply_text("Недостаточно прав для этого действия.")
+        return False
+
     async def start(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        if str(update.effective_chat.id) != str(self.chat_id):
-            await update.message.reply_text("У вас нет доступа к этому боту.")
+        if not await self.check_access(update):
             return
         reply_markup = ReplyKeyboardMarkup(MENU_BUTTONS, resize_keyboard=True)
         await update.message.reply_text(
@@ -99,26 +264,36 @@ class WireGuardBot:
         )
 
     async def menu_handler(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        if str(update.effective_chat.id) != str(self.chat_id):
-            await update.message.reply_text("У вас нет доступа к этому боту.")
+        if not await self.check_access(update):
             return
         text = update.message.text
-        if self.delete_client_mode:
-            await self.handle_delete_client_name(update, context)
-            return
+        chat_id = update.effective_chat.id
+        deadline = self.pending_delete.pop(chat_id, None)
+        if deadline is not None:
+            if time.monotonic() <= deadline:
+                await self.handle_delete_client_name(update, context)
+                return
+            await update.message.reply_text(
+                "⌛️ Время ожидания имени клиента истекло, удаление отменено. Нажмите «🗑 Удалить клиента» ещё раз."
+            )
+            # Это было имя клиента, а не команда меню — «Неизвестная команда» не отвечаем
+            if text not in MENU_TEXTS:
+                return
         if text == "📊 Статус WireGuard":
             await self.show_status_menu(update, context)
         elif text == "👥 Список клиентов":
             await self.show_clients_menu(update, context)
         elif text == "🗑 Удалить клиента":
-            self.delete_client_mode = True
-            await update.message.reply_text("Введите имя клиента (без .conf), которого нужно удалить:")
+            if not await self.check_access(update, ROLE_ADMIN):
+                return
+            self.pending_delete[chat_id] = time.monotonic() + CONVERSATION_TIMEOUT
+            await update.message.reply_text("Введите имя клиента (без .conf), которого нужно удалить, или /cancel для отмены:")
         else:
             await update.message.reply_text("Неизвестная команда. Используйте меню.")
 
     async def show_status_menu(self, update, context):
         try:
-            status = self.get_wg_interface_status()
+            status = (await asyncio.to_thread(self.get_snapshot)).render_status()
             if status:
                 await update.message.reply_text(
                     f"📊 Статус WireGuard:\n\n<pre>{status}</pre>",
@@ -131,30 +306,28 @@ class WireGuardBot:
 
     async def show_clients_menu(self, update, context):
         try:
-            configs = self.get_wg_configs()
+            snapshot = await asyncio.to_thread(self.get_snapshot)
+            configs = snapshot.peers
             if configs:
-                wg0_lines = self.read_file('/etc/wireguard/wg0.conf')
                 message = "👥 <b>Список клиентов WireGuard:</b>\n\n"
                 for i, config in enumerate(configs, 1):
                     peer = config.get('peer', 'Неизвестно')
                     latest_handshake = config.get('latest handshake', 'Нет данных')
                     transfer = config.get('transfer', 'Нет данных')
-                    # Поиск имени клиента по публичному ключу (аналогично find_client_name_by_pubkey)
-                    client_name = None
-                    if peer and wg0_lines:
-                        for idx, line in enumerate(wg0_lines):
-                            if line.strip().startswith('PublicKey') and peer in line:
-                                for j in range(idx-1, idx-3, -1):
-                                    if j >= 0 and wg0_lines[j].strip().lower().startswith('# client:'):
-                                        client_name = wg0_lines[j].strip()[9:].strip()
-                                        break
-                                break
+                    client_name = snapshot.names.get(peer)
                     message += f"<b>{i}. Peer:</b> <code>{peer[:20]}...</code>"
                     if client_name:
                         message += f"\n   📝 Имя конфига: <b>{client_name}</b>"
                     message += f"\n   📡 Последний handshake: {latest_handshake}"
-                    message += f"\n   📊 Трафик: {transfer}\n\n"
-                await update.message.reply_text(message, parse_mode=ParseMode.HTML)
+                    message += f"\n   📊 Трафик: {transfer}"
+                    totals = self.accounting.get_totals(peer)
+                    message += f"\n   📦 За месяц: {views.format_totals(totals['month'])}\n\n"
+                buttons = [
+                    InlineKeyboardButton(views.peer_button_label(snapshot, c['peer']), callback_data=f"peer:{c['peer']}")
+                    for c in configs[:views.MAX_PEER_BUTTONS]
+                ]
+                reply_markup = InlineKeyboardMarkup([buttons[i:i + 2] for i in range(0, len(buttons), 2)])
+                await update.message.reply_text(message, parse_mode=ParseMode.HTML, reply_markup=reply_markup)
             else:
                 await update.message.reply_text("📭 Нет активных клиентов")
         except Exception as e:
@@ -162,10 +335,28 @@ class WireGuardBot:
 
     async def handle_delete_client_name(self, update, context):
         name = update.message.text.strip()
-        self.delete_client_mode = False
         if not name:
             await update.message.reply_text("Имя не может быть пустым. Операция отменена.")
             return
+        if not await self.check_access(update, ROLE_ADMIN):
+            return
+        async with self.wg_lock:
+            await self.delete_client(update, context, name)
+
+    async def cancel_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """/cancel — отменяет ожидание имени удаляемого клиента в этом чате"""
+        if not await self.check_access(update):
+            return
+        if self.pending_delete.pop(update.effective_chat.id, None) is not None:
+            await update.message.reply_text("Удаление отменено.")
+        else:
+            await update.message.reply_text("Нечего отменять.")
+
+    async def delete_client(self, update, context, name):
+        # Без ревизии «до» изменение не откатить — в этом случае ничего не трогаем
+        if await asyncio.to_thread(self.save_revision, f"до удаления {name}") is None:
+            await update.message.reply_text("❌ Не удалось сохранить ревизию конфигурации, удаление отменено.")
+            return
         # Удаляем .conf файл локально
         conf_path = f"/etc/wireguard/clients/{name}.conf"
         if os.path.exists(conf_path):
@@ -215,13 +406,306 @@ class WireGuardBot:
         # Перезаписываем wg0.conf
         with open('/etc/wireguard/wg0.conf', 'w', encoding='utf-8') as f:
             f.write('\n'.join(new_lines) + '\n')
+        await asyncio.to_thread(self.save_revision, f"после удаления {name}")
+        latest = self.snapshots.latest
+        self.history.record_deleted(name, latest.find_peer(name) if latest else None)
         # Перезапускаем WireGuard для применения изменений
         await update.message.reply_text("🔄 Перезапуск WireGuard интерфейса...")
-        if self.restart_wireguard():
+        restarted = await asyncio.to_thread(self.restart_wireguard)
+        # Сбрасываем снимок только после перезапуска, иначе кэш заполнится старым состоянием интерфейса
+        self.snapshots.invalidate()
+        if restarted:
             await update.message.reply_text(f"✅ Клиент {name} успешно удалён и WireGuard перезапущен")
         else:
             await update.message.reply_text(f"⚠️ Клиент {name} удалён, но произошла ошибка при перезапуске WireGuard")
 
+    async def rollback_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """/rollback — последние ревизии конфигурации; /rollback <номер> — вернуть ревизию"""
+        if not await self.check_access(update, ROLE_ADMIN):
+            return
+        if not context.args:
+            revisions = self.config_store.revisions()
+            buttons = [InlineKeyboardButton(f"↩️ #{revision_id}", callback_data=f"rollback:{revision_id}") for revision_id, _, _ in revisions]
+            reply_markup = InlineKeyboardMarkup([buttons[i:i + 3] for i in range(0, len(buttons), 3)]) if buttons else None
+            await update.message.reply_text(
+                views.render_revisions(revisions, self.config_store.stats()), parse_mode=ParseMode.HTML, reply_markup=reply_markup
+            )
+            return
+        if not context.args[0].lstrip('#').isdigit():
+            await update.message.reply_text("Использование: /rollback [номер ревизии]")
+            return
+        await self.rollback_to(update.message, int(context.args[0].lstrip('#')))
+
+    async def rollback_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Кнопка ревизии под списком /rollback"""
+        query = update.callback_query
+        await query.answer()
+        if not await self.check_access(update, ROLE_ADMIN):
+            return
+        await self.rollback_to(query.message, int(query.data.split(':', 1)[1]))
+
+    async def rollback_to(self, message, revision_id):
+        async with self.wg_lock:
+            try:
+                files = await asyncio.to_thread(self.config_store.checkout, revision_id)
+            except KeyError:
+                await message.reply_text(f"Ревизия #{revision_id} не найдена.")
+                return
+            try:
+                # Текущее состояние тоже сохраняем — откат можно отменить
+                if await asyncio.to_thread(self.save_revision, f"до отката к #{revision_id}") is None:
+                    error = "не удалось сохранить текущую ревизию, откат отменён"
+                else:
+                    error = await asyncio.to_thread(self.apply_revision, files)
+            except Exception as e:
+                error = str(e)
+            self.snapshots.invalidate()
+        if error:
+            await message.reply_text(f"⚠️ Ошибка отката к ревизии #{revision_id}: {error}")
+        else:
+            await message.reply_text(f"✅ Конфигурация возвращена к ревизии #{revision_id} и применена без перезапуска интерфейса")
+
+    async def current_drift(self):
+        """Отчёт о расхождениях по свежему снимку и списку файлов clients/"""
+        snapshot = await asyncio.to_thread(self.get_snapshot, True)
+        client_files = await asyncio.to_thread(self.get_wg_config_files)
+        return self.drift.check(snapshot, client_files), snapshot
+
+    def drift_keyboard(self, report):
+        buttons = []
+        if report.interface_drift:
+            buttons.append([InlineKeyboardButton("🔄 Применить wg0.conf", callback_data="drift:sync")])
+        if report.can_remove_files:
+            buttons.append([InlineKeyboardButton(f"🗑 Удалить файлы без пира ({len(report.orphan_files)})", callback_data="drift:files")])
+        buttons.append([InlineKeyboardButton("🔁 Обновить", callback_data="drift:refresh")])
+        return InlineKeyboardMarkup(buttons)
+
+    async def drift_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """/drift — расхождения между wg0.conf, интерфейсом и каталогом clients/"""
+        if not await self.check_access(update):
+            return
+        try:
+            report, snapshot = await self.current_drift()
+        except Exception as e:
+            await update.message.reply_text(f"Ошибка проверки расхождений: {e}")
+            return
+        self.drift.acknowledge(report)
+        await update.message.reply_text(
+            views.render_drift(report, snapshot), parse_mode=ParseMode.HTML, reply_markup=self.drift_keyboard(report)
+        )
+
+    async def drift_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Кнопки исправления под отчётом /drift и оповещением о расхождениях"""
+        query = update.callback_query
+        await query.answer()
+        action = query.data.split(':', 1)[1]
+        if not await self.check_access(update, ROLE_VIEWER if action == 'refresh' else ROLE_ADMIN):
+            return
+        error = None
+        try:
+            if action in ('sync', 'files'):
+                async with self.wg_lock:
+                    # Исправляем то, что расходится сейчас, а не на момент отправки отчёта
+                    report, _ = await self.current_drift()
+                    if not report.config_checked or (action == 'files' and not report.files_checked):
+                        error = "не удалось прочитать wg0.conf или список файлов clients/, исправление отменено"
+                    elif await asyncio.to_thread(self.save_revision, "до исправления расхождений") is None:
+                        error = "не удалось сохранить ревизию конфигурации, исправление отменено"
+                    elif action == 'sync' and report.interface_drift:
+                        error = await asyncio.to_thread(self.sync_wireguard)
+                    elif action == 'files' and report.can_remove_files:
+                        await asyncio.to_thread(self.remove_client_files, report.orphan_files)
+                    self.snapshots.invalidate()
+            report, snapshot = await self.current_drift()
+        except Exception as e:
+            await query.message.reply_text(f"Ошибка исправления расхождений: {e}")
+            return
+        self.drift.acknowledge(report)
+        message = views.render_drift(report, snapshot)
+        if error:
+            message = f"⚠️ Исправление не выполнено: {html.escape(error)}\n\n" + message
+        try:
+            await query.edit_message_text(message, parse_mode=ParseMode.HTML, reply_markup=self.drift_keyboard(report))
+        except Exception as e:
+            # Telegram не даёт править сообщение без изменений
+            logger.debug(f"Отчёт о расхождениях не изменился: {e}")
+
+    async def send_drift_alert(self, bot, report, snapshot):
+        """Оповещение об изменении набора расхождений конфигурации"""
+        message = views.render_drift(report, snapshot)
+        for chat_id in self.access.chat_ids:
+            try:
+                await bot.send_message(
+                    chat_id=chat_id, text=message, parse_mode=ParseMode.HTML, reply_markup=self.drift_keyboard(report)
+                )
+            except Exception as e:
+                self.metrics.inc_telegram_send_failures()
+                logger.error(f"Ошибка отправки оповещения в чат {chat_id}: {e}")
+
+    async def peer_detail_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Кнопка клиента в списке клиентов — карточка пира"""
+        query = update.callback_query
+        await query.answer()
+        if not await self.check_access(update):
+            return
+        await self.send_peer_details(query.message, query.data.split(':', 1)[1])
+
+    async def peer_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """/peer <имя или публичный ключ> — карточка пира"""
+        if not await self.check_access(update):
+            return
+        if not context.args:
+            await update.message.reply_text("Использование: /peer <имя клиента или публичный ключ>")
+            return
+        await self.send_peer_details(update.message, ' '.join(context.args))
+
+    async def send_peer_details(self, message, query):
+        try:
+            snapshot = await asyncio.to_thread(self.get_snapshot)
+            pubkey = snapshot.find_peer(query)
+            if pubkey is None:
+                await message.reply_text(f"Клиент {html.escape(query)} не найден.", parse_mode=ParseMode.HTML)
+                return
+            totals = self.accounting.get_totals(pubkey)
+            await message.reply_text(views.render_peer_details(
+                snapshot, pubkey, totals, self.geoip.describe(snapshot.by_key.get(pubkey, {}).get('endpoint'))
+            ), parse_mode=ParseMode.HTML)
+        except Exception as e:
+            await message.reply_text(f"❌ Ошибка: {str(e)}")
+
+    async def traffic_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """/traffic [ГГГГ-ММ] — накопленный трафик клиентов за месяц"""
+        if not await self.check_access(update):
+            return
+        period = context.args[0] if context.args else self.accounting.month
+        try:
+            rows = self.accounting.period_report(period)
+            latest = self.snapshots.latest
+            names = latest.names if latest else await asyncio.to_thread(self.get_pubkey_to_name_map)
+            await update.message.reply_text(views.render_traffic_report(period, rows, names), parse_mode=ParseMode.HTML)
+        except Exception as e:
+            await update.message.reply_text(f"❌ Ошибка: {str(e)}")
+
+    async def history_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """/history <имя или публичный ключ> — журнал событий клиента"""
+        if not await self.check_access(update):
+            return
+        if not context.args:
+            await update.message.reply_text("Использование: /history <имя клиента или публичный ключ>")
+            return
+        query = ' '.join(context.args)
+        try:
+            events = self.history.query(query)
+            await update.message.reply_text(views.render_history(query, events), parse_mode=ParseMode.HTML)
+        except Exception as e:
+            await update.message.reply_text(f"❌ Ошибка: {str(e)}")
+
+    async def search_clients(self, query, limit=20):
+        snapshot = await asyncio.to_thread(self.get_snapshot)
+        # Переиндексация по новому снимку может быть заметной — не в цикле событий
+        await asyncio.to_thread(self.search_index.update_from_snapshot, snapshot)
+        return self.search_index.search(query, limit)
+
+    async def find_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """/find <часть имени, ключа или IP> — поиск клиентов"""
+        if not await self.check_access(update):
+            return
+        if not context.args:
+            await update.message.reply_text("Использование: /find <часть имени, публичного ключа или IP>")
+            return
+        query = ' '.join(context.args)
+        try:
+            results = await self.search_clients(query)
+            buttons = [
+                InlineKeyboardButton(name or f"{pubkey[:10]}…", callback_data=f"peer:{pubkey}")
+                for _, (name, pubkey, _) in results if pubkey
+            ]
+            reply_markup = InlineKeyboardMarkup([buttons[i:i + 2] for i in range(0, len(buttons), 2)]) if buttons else None
+            await update.message.reply_text(
+                views.render_search_results(query, results), parse_mode=ParseMode.HTML, reply_markup=reply_markup
+            )
+        except Exception as e:
+            await update.message.reply_text(f"❌ Ошибка: {str(e)}")
+
+    async def inline_query(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Инлайн-режим: `@бот <запрос>` в любом чате — поиск клиентов"""
+        inline = update.inline_query
+        if not self.access.allows(inline.from_user.id) or not inline.query.strip():
+            await inline.answer([], cache_time=0, is_personal=True)
+            return
+        results = await self.search_clients(inline.query)
+        articles = [
+            InlineQueryResultArticle(
+                id=str(i),
+                title=name or f"{pubkey[:20]}...",
+                description=views.describe_search_result((name, pubkey, ips)),
+                input_message_content=InputTextMessageContent(
+                    f"/peer {name or pubkey}" if pubkey else f"📄 {name}: файл клиента без пира в wg0.conf"
+                ),
+            )
+            for i, (_, (name, pubkey, ips)) in enumerate(results)
+        ]
+        await inline.answer(articles, cache_time=5, is_personal=True)
+
+    async def export_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """/export [csv|json] [gz] — полная выгрузка пиров документом"""
+        if not await self.check_access(update):
+            return
+        args = [arg.lower() for arg in context.args]
+        fmt = next((arg for arg in args if arg in export.FORMATS), 'csv')
+        compress = 'gz' in args or 'gzip' in args
+        try:
+            snapshot = await asyncio.to_thread(self.get_snapshot)
+            records = export.iter_peer_records(snapshot, self.accounting.get_totals, self.geoip)
+            document, filename = await asyncio.to_thread(export.write_export, records, fmt, compress)
+            with document:
+                await update.message.reply_document(
+                    document=document, filename=filename,
+                    caption=f"📤 Пиров: {len(snapshot.by_key.keys() | snapshot.names.keys())}"
+                )
+        except Exception as e:
+            await update.message.reply_text(f"❌ Ошибка: {str(e)}")
+
+    async def dashboard_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """/dashboard — закреплённая сводка, которую обновляет мониторинг; /dashboard off — отключить"""
+        if not await self.check_access(update):
+            return
+        chat_id = update.effective_chat.id
+        if context.args and context.args[0] == 'off':
+            if self.dashboard.detach(chat_id) is None:
+                await update.message.reply_text("Сводка в этом чате не включена.")
+            else:
+                await update.message.reply_text("Сводка больше не обновляется.")
+            return
+        try:
+            snapshot = await asyncio.to_thread(self.get_snapshot)
+            await self.dashboard.attach(context.bot, chat_id, snapshot)
+        except Exception as e:
+            await update.message.reply_text(f"❌ Ошибка: {str(e)}")
+
+    async def perf_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """/perf — перцентили задержек; /perf profile — включить/выключить профайлер"""
+        if not await self.check_access(update):
+            return
+        if context.args and context.args[0] == 'profile':
+            if not await self.check_access(update, ROLE_ADMIN):
+                return
+            if perf.profiler.running:
+                profile = perf.profiler.stop()
+                await update.message.reply_document(
+                    document=profile.encode('utf-8'),
+                    filename='wg-bot-profile.folded',
+                    caption="🔥 Профиль (collapsed stacks для flamegraph.pl / speedscope)"
+                )
+            else:
+                perf.profiler.start()
+                await update.message.reply_text("🔥 Профайлер запущен. Повторите /perf profile, чтобы получить профиль.")
+            return
+        await update.message.reply_text(
+            f"⏱ <b>Производительность:</b>\n\n<pre>{html.escape(perf.recorder.format_report())}</pre>",
+            parse_mode=ParseMode.HTML
+        )
+
     def find_client_comment_in_wg0(self, peer_pubkey):
         lines = self.read_file('/etc/wireguard/wg0.conf')
         if not lines:
@@ -245,6 +729,14 @@ class WireGuardBot:
             pass
         return None
 
+    def get_pubkey_to_name_map(self):
+        """Возвращает словарь pubkey -> client_name для всех клиентов из wg0.conf"""
+        lines = self.read_file(WG0_CONF_PATH)
+        if not lines:
+            return {}
+        with perf.span('wg0_scan', 'pubkey_to_name'):
+            return parse_wg0_names(lines)
+
     async def send_new_client_notification(self, context, config, bot=None):
         message = "🆕 <b>Новый клиент WireGuard!</b>\n\n"
         client_comment = None
@@ -273,17 +765,45 @@ class WireGuardBot:
             message += f"🌐 <b>Разрешенные IP:</b> {config['allowed_ips']}\n"
         if config.get('created_time'):
             message += f"🕐 <b>Создан:</b> {config['created_time']}\n"
+        location = self.geoip.describe(config.get('endpoint'))
+        if location:
+            message += f"🌍 <b>Локация:</b> {html.escape(location)}\n"
         tg_bot = None
         if context and hasattr(context, 'bot'):
             tg_bot = context.bot
         elif bot:
             tg_bot = bot
         if tg_bot:
-            await tg_bot.send_message(
-                chat_id=self.chat_id,
-                text=message,
-                parse_mode=ParseMode.HTML
-            )
+            for chat_id in self.access.chat_ids:
+                try:
+                    await tg_bot.send_message(
+                        chat_id=chat_id,
+                        text=message,
+                        parse_mode=ParseMode.HTML
+                    )
+                except Exception as e:
+                    self.metrics.inc_telegram_send_failures()
+                    logger.error(f"Ошибка отправки уведомления в чат {chat_id}: {e}")
+
+    async def send_country_change_alert(self, bot, snapshot, pubkey, old, new):
+        """Оповещение о смене страны endpoint'а пира"""
+        name = snapshot.names.get(pubkey)
+        endpoint = snapshot.by_key.get(pubkey, {}).get('endpoint', '')
+        message = "🚨 <b>Клиент подключился из другой страны!</b>\n\n"
+        if name:
+            message += f"📝 <b>Имя клиента:</b> {html.escape(name)}\n"
+        message += f"🔑 <b>Публичный ключ:</b> <code>{pubkey[:20]}...</code>\n"
+        message += f"🌍 <b>Страна:</b> {geoip.country_flag(old)} {old} → {geoip.country_flag(new)} {new}\n"
+        message += f"📍 <b>Endpoint:</b> {html.escape(endpoint)}"
+        location = self.geoip.describe(endpoint)
+        if location:
+            message += f" ({html.escape(location)})"
+        for chat_id in self.access.chat_ids:
+            try:
+                await bot.send_message(chat_id=chat_id, text=message, parse_mode=ParseMode.HTML)
+            except Exception as e:
+                self.metrics.inc_telegram_send_failures()
+                logger.error(f"Ошибка отправки оповещения в чат {chat_id}: {e}")
 
     def get_current_peers(self):
         configs = self.get_wg_configs()
@@ -297,16 +817,17 @@ class WireGuardBot:
         return None
 
     def get_wg_config_files(self):
-        """Получает список файлов конфигураций клиентов"""
+        """Получает список файлов конфигураций клиентов (None, если список получить не удалось)"""
         try:
-            result = subprocess.run(["ls", "/etc/wireguard/clients/"], capture_output=True, text=True)
+            result = self.run_subprocess(["ls", "/etc/wireguard/clients/"])
             if result.returncode == 0:
                 files = [f.strip() for f in result.stdout.split('\n') if f.strip()]
                 return files
-            return []
+            logger.error(f"Ошибка получения файлов конфигураций: {result.stderr.strip()}")
+            return None
         except Exception as e:
             logger.error(f"Ошибка получения файлов конфигураций: {e}")
-            return []
+            return None
 
     def parse_config_file_info(self, config_path):
         """Парсит информацию из файла конфигурации клиента"""
@@ -326,7 +847,7 @@ class WireGuardBot:
             
             # Получаем время создания файла
             try:
-                result = subprocess.run(["stat", "-c", "%y", config_path], capture_output=True, text=True)
+                result = self.run_subprocess(["stat", "-c", "%y", config_path])
                 if result.returncode == 0:
                     config_info['created_time'] = result.stdout.strip()
             except:
@@ -349,20 +870,50 @@ class WireGuardBot:
             logger.error(f"Ошибка парсинга файла {config_path}: {e}")
             return None
 
+    async def post_init(self, application):
+        self.app_loop = asyncio.get_running_loop()
+        self.app_ready.set()
+
+    def run_on_app_loop(self, coro, timeout=MONITOR_SEND_TIMEOUT):
+        """Выполняет корутину в цикле приложения из потока мониторинга и ждёт результата.
+
+        Клиент httpx бота привязан к циклу приложения, поэтому отправлять
+        сообщения из собственного цикла потока нельзя.
+        """
+        return asyncio.run_coroutine_threadsafe(coro, self.app_loop).result(timeout)
+
     def monitoring_loop(self, bot):
-        import asyncio
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
+        self.app_ready.wait()
         prev_peers = set()
         while True:
             try:
-                current_peers = self.get_current_peers()
+                started = time.monotonic()
+                snapshot = self.get_snapshot(fresh=True)
+                configs = snapshot.peers
+                self.metrics.update_peers(configs, snapshot.names)
+                self.history.record_snapshot(snapshot)
+                self.accounting.record_snapshot(snapshot)
+                self.metrics.observe_poll(time.monotonic() - started)
+                # None (список получить не удалось) — индекс сохраняет прежний список файлов
+                client_files = self.get_wg_config_files()
+                self.search_index.update_from_snapshot(snapshot, client_files)
+                for pubkey, old, new in self.geoip.country_changes(snapshot):
+                    self.run_on_app_loop(self.send_country_change_alert(bot, snapshot, pubkey, old, new))
+                # Пока бот сам меняет конфигурацию, источники временно расходятся — не проверяем
+                if not self.wg_lock.locked():
+                    report = self.drift.observe(snapshot, client_files)
+                    if report is not None:
+                        self.run_on_app_loop(self.send_drift_alert(bot, report, snapshot))
+                if self.dashboard.active:
+                    self.run_on_app_loop(self.dashboard.refresh(bot, snapshot))
+                configs_by_peer = {c['peer']: c for c in configs}
+                current_peers = set(configs_by_peer)
                 new_peers = current_peers - prev_peers
                 if new_peers:
                     for peer in new_peers:
-                        config = self.get_peer_info(peer)
+                        config = configs_by_peer.get(peer)
                         if config:
-                            loop.run_until_complete(self.send_new_client_notification(None, config, bot=bot))
+                            self.run_on_app_loop(self.send_new_client_notification(None, config, bot=bot))
                     prev_peers = current_peers
                 else:
                     prev_peers = current_peers
@@ -373,10 +924,30 @@ class WireGuardBot:
     def run(self):
         application = self.application
         application.add_handler(CommandHandler("start", self.start))
+        application.add_handler(CommandHandler("cancel", self.cancel_command))
+        application.add_handler(CommandHandler("find", self.find_command))
+        application.add_handler(CommandHandler("export", self.export_command))
+        application.add_handler(CommandHandler("dashboard", self.dashboard_command))
+        application.add_handler(CommandHandler("rollback", self.rollback_command))
+        application.add_handler(CommandHandler("drift", self.drift_command))
+        application.add_handler(CommandHandler("perf", self.perf_command))
+        application.add_handler(CommandHandler("peer", self.peer_command))
+        application.add_handler(CommandHandler("history", self.history_command))
+        application.add_handler(CommandHandler("traffic", self.traffic_command))
+        application.add_handler(CallbackQueryHandler(self.peer_detail_callback, pattern=r'^peer:'))
+        application.add_handler(CallbackQueryHandler(self.rollback_callback, pattern=r'^rollback:'))
+        application.add_handler(CallbackQueryHandler(self.drift_callback, pattern=r'^drift:'))
+        application.add_handler(InlineQueryHandler(self.inline_query))
         application.add_handler(MessageHandler(filters.TEXT & (~filters.COMMAND), self.menu_handler))
         application.add_handler(CallbackQueryHandler(self.menu_handler))
         print("🤖 WireGuard Bot (Локальный) запущен...")
-        application.run_polling(allowed_updates=Update.ALL_TYPES)
+        if self.webhook_config:
+            try:
+                asyncio.run(webhook.serve(application, self.webhook_config, Update.ALL_TYPES))
+            except KeyboardInterrupt:
+                pass
+        else:
+            application.run_polling(allowed_updates=Update.ALL_TYPES)
 
 if __name__ == '__main__':
     # Загружаем конфигурацию
@@ -388,5 +959,14 @@ if __name__ == '__main__':
     
     bot_token = config["BOT_TOKEN"]
     chat_id = config["CHAT_ID"]
-    bot = WireGuardBot(bot_token, chat_id)
+    bot = WireGuardBot(bot_token, chat_id, config.get("METRICS_PORT"), config.get("METRICS_ADDR", DEFAULT_METRICS_ADDR),
+                       snapshot_ttl=config.get("SNAPSHOT_TTL", DEFAULT_TTL),
+                       history_path=config.get("HISTORY_DB", DEFAULT_HISTORY_PATH),
+                       traffic_path=config.get("TRAFFIC_DB", DEFAULT_TRAFFIC_PATH),
+                       admins=config.get("ADMINS"),
+                       webhook_config=webhook.webhook_settings(config),
+                       api_url=config.get("TELEGRAM_API_URL"),
+                       dashboard_path=config.get("DASHBOARD_FILE", DEFAULT_DASHBOARD_PATH),
+                       geoip_path=config.get("GEOIP_DB"), geoip_asn_path=config.get("GEOIP_ASN_DB"),
+                       revisions_path=config.get("REVISIONS_DB", DEFAULT_REVISIONS_PATH))
     bot.run() 
\ No newline at end of file
@@ -0,0 +1,198 @@
+import hashlib
+import json
+import logging
+import os
+import shlex
+import tarfile
+import threading
+
+from remote_exec import RemoteCommand
+
+logger = logging.getLogger(__name__)
+
+REMOTE_CLIENTS_DIR = '/etc/wireguard/clients'
+DEFAULT_MIRROR_DIR = 'wg_clients_mirror'
+MANIFEST_NAME = '.manifest.json'
+SYNC_TIMEOUT = 60
+SYNC_MAX_BYTES = 256 * 1024 * 1024
+# Разделитель между манифестом и tar-потоком в выводе удалённой команды
+SEPARATOR = b'--\n'
+
+# Удалённая часть синхронизации: на stdin приходит локальный манифест
+# (`sha256<TAB>путь`), в ответ — манифест каталога (путь, размер, mtime, sha256),
+# разделитель и tar только тех файлов, чей хэш отличается от локального.
+# Список файлов передаётся tar через stdin: xargs разбил бы длинный список
+# на несколько архивов подряд, а распаковка читает только первый.
+SYNC_SCRIPT = r"""
+cd {directory} 2>/dev/null || {{ echo '--'; exit 0; }}
+listing=$( {{ cat; echo; echo '#files'; find . -type f -printf '%s\t%T@\t%P\n'; echo '#hashes'; find . -type f -print0 | xargs -0r sha256sum; }} | awk '
+BEGIN {{ FS = "\t"; phase = 0 }}
+$0 == "#files" {{ phase = 1; next }}
+$0 == "#hashes" {{ phase = 2; next }}
+phase == 0 {{ if (NF == 2) known[$2] = $1; next }}
+phase == 1 {{ size[$3] = $1; mtime[$3] = $2; next }}
+{{
+    h = substr($0, 1, 64); p = substr($0, 67); sub(/^\.\//, "", p)
+    print "M\t" p "\t" size[p] "\t" mtime[p] "\t" h
+    if (known[p] != h) print "C\t" p
+}}' )
+printf '%s\n' "$listing" | sed -n 's/^M\t//p'
+echo '--'
+printf '%s\n' "$listing" | sed -n 's/^C\t//p' | tr '\n' '\0' | tar -cf - --null -T -
+"""
+
+
+class SyncError(Exception):
+    """Синхронизация каталога клиентов не удалась"""
+
+
+class ClientsMirror:
+    """Локальное зеркало каталога клиентов WireGuard на сервере.
+
+    Каждая синхронизация — одна SSH-команда: сервер получает локальный
+    манифест, возвращает свой (путь, размер, mtime, sha256) и tar только
+    изменившихся файлов, который распаковывается прямо из канала (stderr
+    читается одновременно со stdout, см. RemoteCommand). Новые и
+    удалённые файлы определяются по разнице манифестов, а не по времени,
+    поэтому расхождение часов сервера и бота ни на что не влияет.
+    Синхронизация и чтение зеркала выполняются под одной блокировкой: зеркало
+    вызывают и поток мониторинга, и обработчики команд.
+    """
+
+    def __init__(self, root=DEFAULT_MIRROR_DIR, remote_dir=REMOTE_CLIENTS_DIR):
+        self.root = root
+        self.remote_dir = remote_dir
+        os.makedirs(self.root, exist_ok=True)
+        self.lock = threading.Lock()
+        # путь -> {'size', 'mtime', 'sha256'}
+        self.manifest = self._load_manifest()
+
+    def _manifest_path(self):
+        return os.path.join(self.root, MANIFEST_NAME)
+
+    def _load_manifest(self):
+        try:
+            with open(self._manifest_path(), 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+            # Файлы, пропавшие из зеркала, забываем — сервер передаст их заново
+            return {path: entry for path, entry in manifest.items() if os.path.isfile(self.local_path(path))}
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logger.error(f"Манифест зеркала повреждён, зеркало будет загружено заново: {e}")
+            return {}
+
+    def _save_manifest(self):
+        tmp_path = f"{self._manifest_path()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.manifest, f)
+        os.replace(tmp_path, self._manifest_path())
+
+    def local_path(self, path):
+        root = os.path.abspath(self.root)
+        full = os.path.abspath(os.path.join(root, path))
+        if not full.startswith(root + os.sep):
+            raise SyncError(f"путь вне зеркала: {path}")
+        return full
+
+    def files(self):
+        """Пути файлов в зеркале (относительно каталога клиентов)"""
+        with self.lock:
+            return sorted(self.manifest)
+
+    def read(self, path):
+        with self.lock, open(self.local_path(path), 'r', encoding='utf-8', errors='replace') as f:
+            return f.read()
+
+    def read_bytes(self, path):
+        with self.lock, open(self.local_path(path), 'rb') as f:
+            return f.read()
+
+    def sync(self, ssh_client):
+        """Синхронизирует зеркало и возвращает (новые, изменённые, удалённые) пути"""
+        with self.lock:
+            return self._sync(ssh_client)
+
+    def _sync(self, ssh_client):
+        command = RemoteCommand(ssh_client, SYNC_SCRIPT.format(directory=shlex.quote(self.remote_dir)),
+                                max_bytes=SYNC_MAX_BYTES, timeout=SYNC_TIMEOUT)
+        try:
+            known = ''.join(f"{entry['sha256']}\t{path}\n" for path, entry in self.manifest.items())
+            command.send(known.encode('utf-8'))
+            stream = command.stream()
+            remote = self._read_manifest(stream)
+            fetched = self._extract(stream, remote)
+            # Дочитываем хвост tar, чтобы получить код завершения
+            stream.read()
+        finally:
+            command.channel.close()
+        status = command.exit_status
+        stderr = command.stderr.strip()
+        if status != 0:
+            raise SyncError(f"синхронизация завершилась с кодом {status}: {stderr}")
+        added = [path for path in remote if path not in self.manifest]
+        changed = [path for path in fetched if path in self.manifest]
+        removed = [path for path in self.manifest if path not in remote]
+        missing = [path for path in remote if path not in fetched and self.manifest.get(path, {}).get('sha256') != remote[path]['sha256']]
+        if missing:
+            raise SyncError(f"сервер не передал изменённые файлы: {', '.join(missing)}")
+        for path in removed:
+            try:
+                os.remove(self.local_path(path))
+            except FileNotFoundError:
+                pass
+        self.manifest = remote
+        if added or changed or removed:
+            self._save_manifest()
+        return added, changed, removed
+
+    def _read_manifest(self, stream):
+        remote = {}
+        for line in iter(stream.readline, b''):
+            if line == SEPARATOR:
+                return remote
+            fields = line.decode('utf-8', errors='replace').rstrip('\n').split('\t')
+            if len(fields) != 4:
+                continue
+            path, size, mtime, digest = fields
+            remote[path] = {'size': int(size or 0), 'mtime': float(mtime or 0), 'sha256': digest}
+        raise SyncError("оборван вывод манифеста")
+
+    def _extract(self, stream, remote):
+        """Распаковывает tar изменившихся файлов из потока, проверяя хэши"""
+        fetched = set()
+        head = stream.read(1)
+        if not head:
+            return fetched
+        with tarfile.open(fileobj=_Prepend(head, stream), mode='r|') as archive:
+            for member in archive:
+                path = member.name[2:] if member.name.startswith('./') else member.name
+                if not member.isfile() or path not in remote:
+                    continue
+                target = self.local_path(path)
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                data = archive.extractfile(member).read()
+                if hashlib.sha256(data).hexdigest() != remote[path]['sha256']:
+                    raise SyncError(f"хэш {path} не совпал с манифестом")
+                tmp_path = f"{target}.tmp"
+                with open(tmp_path, 'wb') as f:
+                    f.write(data)
+                os.replace(tmp_path, target)
+                fetched.add(path)
+        return fetched
+
+
+class _Prepend:
+    """Файловый объект, возвращающий сначала уже прочитанные байты, затем остаток потока"""
+
+    def __init__(self, head, stream):
+        self.head = head
+        self.stream = stream
+
+    def read(self, size=-1):
+        if not self.head:
+            return self.stream.read(size)
+        head, self.head = self.head, b''
+        if size is None or size < 0:
+            return head + self.stream.read()
+        return head + self.stream.read(size - len(head)) if size > len(head) else head
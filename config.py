@@ -1,6 +1,8 @@
 import os
 import re
 
+from access import parse_admins
+
 def load_config():
     """Загружает конфигурацию из файла api_token.txt"""
     config = {}
@@ -19,6 +21,11 @@ def load_config():
         if chat_id_match:
             config['CHAT_ID'] = int(chat_id_match.group(1))
             
+        # Извлекаем дополнительные авторизованные чаты и их роли (ADMINS=111:admin,222:viewer)
+        admins_match = re.search(r'ADMINS=([^\n]+)', content)
+        if admins_match:
+            config['ADMINS'] = parse_admins(admins_match.group(1))
+            
         # Извлекаем настройки WireGuard
         wg_ip_match = re.search(r'WG_SERVER_IP=([^\n]+)', content)
         if wg_ip_match:
@@ -45,6 +52,85 @@ def load_config():
         if ssh_pass_match:
             config['SSH_PASSWORD'] = ssh_pass_match.group(1).strip()
             
+        # Извлекаем режим работы бота (local / ssh)
+        mode_match = re.search(r'BOT_MODE=([^\n]+)', content)
+        if mode_match:
+            config['BOT_MODE'] = mode_match.group(1).strip()
+            
+        # Извлекаем время жизни кэша снимков WireGuard (секунды)
+        snapshot_ttl_match = re.search(r'SNAPSHOT_TTL=(\d+)', content)
+        if snapshot_ttl_match:
+            config['SNAPSHOT_TTL'] = int(snapshot_ttl_match.group(1))
+            
+        # Извлекаем путь к базе истории событий
+        history_db_match = re.search(r'HISTORY_DB=([^\n]+)', content)
+        if history_db_match:
+            config['HISTORY_DB'] = history_db_match.group(1).strip()
+            
+        # Извлекаем путь к базе учёта трафика
+        traffic_db_match = re.search(r'TRAFFIC_DB=([^\n]+)', content)
+        if traffic_db_match:
+            config['TRAFFIC_DB'] = traffic_db_match.group(1).strip()
+            
+        # Извлекаем путь к файлу с сообщениями закреплённой сводки
+        dashboard_file_match = re.search(r'DASHBOARD_FILE=([^\n]+)', content)
+        if dashboard_file_match:
+            config['DASHBOARD_FILE'] = dashboard_file_match.group(1).strip()
+            
+        # Извлекаем пути к локальным базам GeoIP (MaxMind .mmdb: Country/City и ASN)
+        geoip_db_match = re.search(r'GEOIP_DB=([^\n]+)', content)
+        if geoip_db_match:
+            config['GEOIP_DB'] = geoip_db_match.group(1).strip()
+            
+        geoip_asn_db_match = re.search(r'GEOIP_ASN_DB=([^\n]+)', content)
+        if geoip_asn_db_match:
+            config['GEOIP_ASN_DB'] = geoip_asn_db_match.group(1).strip()
+            
+        # Извлекаем путь к локальному зеркалу каталога клиентов (для bot-ssh.py)
+        mirror_match = re.search(r'CLIENTS_MIRROR=([^\n]+)', content)
+        if mirror_match:
+            config['CLIENTS_MIRROR'] = mirror_match.group(1).strip()
+            
+        # Извлекаем путь к хранилищу ревизий wg0.conf и файлов клиентов
+        revisions_match = re.search(r'REVISIONS_DB=([^\n]+)', content)
+        if revisions_match:
+            config['REVISIONS_DB'] = revisions_match.group(1).strip()
+            
+        # Извлекаем настройки вебхука (без WEBHOOK_URL бот работает через polling)
+        webhook_url_match = re.search(r'WEBHOOK_URL=([^\n]+)', content)
+        if webhook_url_match:
+            config['WEBHOOK_URL'] = webhook_url_match.group(1).strip()
+            
+        webhook_listen_match = re.search(r'WEBHOOK_LISTEN=([^\n]+)', content)
+        if webhook_listen_match:
+            config['WEBHOOK_LISTEN'] = webhook_listen_match.group(1).strip()
+            
+        webhook_port_match = re.search(r'WEBHOOK_PORT=(\d+)', content)
+        if webhook_port_match:
+            config['WEBHOOK_PORT'] = int(webhook_port_match.group(1))
+            
+        webhook_secret_match = re.search(r'WEBHOOK_SECRET=([^\n]+)', content)
+        if webhook_secret_match:
+            config['WEBHOOK_SECRET'] = webhook_secret_match.group(1).strip()
+            
+        webhook_connections_match = re.search(r'WEBHOOK_MAX_CONNECTIONS=(\d+)', content)
+        if webhook_connections_match:
+            config['WEBHOOK_MAX_CONNECTIONS'] = int(webhook_connections_match.group(1))
+            
+        # Извлекаем адрес сервера Bot API (локальный telegram-bot-api или поддельный endpoint для проверки)
+        api_url_match = re.search(r'TELEGRAM_API_URL=([^\n]+)', content)
+        if api_url_match:
+            config['TELEGRAM_API_URL'] = api_url_match.group(1).strip().rstrip('/')
+            
+        # Извлекаем настройки экспорта метрик Prometheus
+        metrics_port_match = re.search(r'METRICS_PORT=(\d+)', content)
+        if metrics_port_match:
+            config['METRICS_PORT'] = int(metrics_port_match.group(1))
+            
+        metrics_addr_match = re.search(r'METRICS_ADDR=([^\n]+)', content)
+        if metrics_addr_match:
+            config['METRICS_ADDR'] = metrics_addr_match.group(1).strip()
+            
     except FileNotFoundError:
         print("Ошибка: Файл api_token.txt не найден!")
         return None
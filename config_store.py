@@ -0,0 +1,161 @@
+import hashlib
+import sqlite3
+import threading
+import time
+import zlib
+
+DEFAULT_REVISIONS_PATH = 'wg_revisions.sqlite3'
+# Средний размер куска в списках хэшей
+CHUNK_AVERAGE = 16
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS objects (
+    hash TEXT PRIMARY KEY,
+    data BLOB NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS revisions (
+    id INTEGER PRIMARY KEY,
+    ts INTEGER NOT NULL,
+    reason TEXT,
+    root TEXT NOT NULL
+);
+"""
+
+
+def split_blocks(data):
+    """Делит конфиг на блоки по секциям `[...]` и комментариям `# Client:`.
+
+    Склейка блоков даёт исходные байты. Комментарий `# Client:` попадает в
+    один блок со своей секцией `[Peer]` (и над ней, и сразу под заголовком),
+    поэтому удаление пира меняет ровно один блок.
+    """
+    blocks = []
+    current = []
+    # 'comment' — в блоке пока только `# Client:`, 'header' — только заголовок секции, 'body' — есть параметры
+    state = 'body'
+    for line in data.splitlines(keepends=True):
+        stripped = line.strip().lower()
+        if stripped.startswith(b'# client:'):
+            boundary = state != 'header'
+            state = 'comment' if boundary else 'header'
+        elif stripped.startswith(b'['):
+            boundary = state != 'comment'
+            state = 'header'
+        else:
+            boundary = False
+            if stripped and not stripped.startswith(b'#'):
+                state = 'body'
+        if boundary and current:
+            blocks.append(b''.join(current))
+            current = []
+        current.append(line)
+    if current:
+        blocks.append(b''.join(current))
+    return blocks
+
+
+def chunk_items(items):
+    """Делит список на куски по содержимому: граница после элемента, чей crc32 кратен CHUNK_AVERAGE.
+
+    Границы зависят только от самих элементов, поэтому вставка или удаление
+    элемента меняет один кусок, а не сдвигает все последующие.
+    """
+    chunks = []
+    current = []
+    for item in items:
+        current.append(item)
+        if zlib.crc32(item) % CHUNK_AVERAGE == 0:
+            chunks.append(current)
+            current = []
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+class ConfigStore:
+    """Ревизии wg0.conf и файлов клиентов с адресацией по содержимому.
+
+    Все данные — объекты, сжатые zlib, под своим sha256: блоки конфигов
+    (секции), списки хэшей блоков каждого файла и манифест ревизии (путь →
+    хэш файла). Длинные списки делятся на куски по содержимому и хранятся
+    деревом, поэтому ревизия после удаления одного пира добавляет только
+    изменившиеся куски, а одинаковые блоки и файлы разных ревизий хранятся
+    один раз. Ревизия, совпадающая с последней, не создаётся.
+    """
+
+    def __init__(self, path=DEFAULT_REVISIONS_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode = WAL")
+        self.db.executescript(SCHEMA)
+
+    def _put(self, data):
+        digest = hashlib.sha256(data).hexdigest()
+        self.db.execute("INSERT OR IGNORE INTO objects (hash, data) VALUES (?, ?)", (digest, zlib.compress(data, 9)))
+        return digest
+
+    def _get(self, digest):
+        row = self.db.execute("SELECT data FROM objects WHERE hash = ?", (digest,)).fetchone()
+        if row is None:
+            raise KeyError(f"объект {digest} не найден")
+        return zlib.decompress(row[0])
+
+    def _put_list(self, items):
+        """Сохраняет список строк bytes деревом кусков и возвращает хэш корня"""
+        level = 0
+        while True:
+            chunks = chunk_items(items)
+            if len(chunks) <= 1 or len(chunks) == len(items):
+                return self._put(b'L%d\n' % level + b'\n'.join(items))
+            items = [self._put(b'L%d\n' % level + b'\n'.join(chunk)).encode() for chunk in chunks]
+            level += 1
+
+    def _get_list(self, digest):
+        header, _, body = self._get(digest).partition(b'\n')
+        items = body.split(b'\n') if body else []
+        if header == b'L0':
+            return items
+        return [item for child in items for item in self._get_list(child.decode())]
+
+    def commit(self, files, reason=None):
+        """Сохраняет набор файлов {путь: bytes} и возвращает (id ревизии, создана ли новая)"""
+        with self.lock, self.db:
+            manifest = []
+            for path, data in sorted(files.items()):
+                blocks = [self._put(block).encode() for block in split_blocks(data)]
+                manifest.append(f"{path}\t{self._put_list(blocks)}".encode())
+            root = self._put_list(manifest)
+            last = self.db.execute("SELECT id, root FROM revisions ORDER BY id DESC LIMIT 1").fetchone()
+            if last and last[1] == root:
+                return last[0], False
+            revision_id = self.db.execute(
+                "INSERT INTO revisions (ts, reason, root) VALUES (?, ?, ?)", (int(time.time()), reason, root)
+            ).lastrowid
+        return revision_id, True
+
+    def checkout(self, revision_id):
+        """Файлы ревизии {путь: bytes}"""
+        with self.lock:
+            row = self.db.execute("SELECT root FROM revisions WHERE id = ?", (revision_id,)).fetchone()
+            if row is None:
+                raise KeyError(f"ревизия {revision_id} не найдена")
+            files = {}
+            for entry in self._get_list(row[0]):
+                path, _, tree = entry.decode().rpartition('\t')
+                files[path] = b''.join(self._get(block.decode()) for block in self._get_list(tree))
+        return files
+
+    def revisions(self, limit=10):
+        """Последние ревизии [(id, ts, причина)], новые первыми"""
+        with self.lock:
+            return self.db.execute(
+                "SELECT id, ts, reason FROM revisions ORDER BY id DESC LIMIT ?", (limit,)
+            ).fetchall()
+
+    def stats(self):
+        """(число ревизий, число объектов, байт в хранилище)"""
+        with self.lock:
+            revisions = self.db.execute("SELECT COUNT(*) FROM revisions").fetchone()[0]
+            objects, size = self.db.execute("SELECT COUNT(*), COALESCE(SUM(LENGTH(data)), 0) FROM objects").fetchone()
+        return revisions, objects, size
@@ -0,0 +1,191 @@
+import hashlib
+import html
+import json
+import logging
+import math
+import os
+import threading
+import time
+
+from views import format_rate
+from wg_show import is_online
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DASHBOARD_PATH = 'wg_dashboard.json'
+# Не чаще одной правки сообщения в чате за это время (секунды)
+MIN_EDIT_INTERVAL = 30
+# Пиры без handshake дольше этого времени в список «недавно активных» не попадают
+RECENT_SECONDS = 3600
+# Возраст handshake округляется, чтобы текст не менялся каждую минуту
+AGE_STEP = 300
+MAX_RECENT = 20
+
+
+def rate_bucket(rate):
+    """Порядок скорости: 0 — нет трафика, 1 — байты/с, 2 — KiB/s, 3 — MiB/s..."""
+    return 0 if rate < 1 else int(math.log(rate, 1024)) + 1
+
+
+class Dashboard:
+    """Закреплённое сообщение со сводкой WireGuard, которое обновляет мониторинг.
+
+    Строки пиров кэшируются и пересобираются только при изменении значений.
+    Хэш считается по состоянию сводки со скоростями, огрублёнными до порядка
+    величины, чтобы цифры скоростей не меняли его на каждом опросе.
+    Сообщение правится, если изменился хэш и с прошлой правки прошло не
+    меньше MIN_EDIT_INTERVAL; идентификаторы сообщений хранятся в файле.
+    """
+
+    def __init__(self, path=DEFAULT_DASHBOARD_PATH, min_interval=MIN_EDIT_INTERVAL):
+        self.path = path
+        self.min_interval = min_interval
+        self.lock = threading.Lock()
+        # chat_id -> message_id
+        self.messages = {}
+        self.hashes = {}
+        self.last_edit = {}
+        # pubkey -> (ключ отображаемых значений, готовая строка)
+        self.fragments = {}
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.messages = {int(chat_id): message_id for chat_id, message_id in json.load(f).items()}
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            logger.error(f"Не удалось прочитать {self.path}: {e}")
+
+    def _save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({str(chat_id): message_id for chat_id, message_id in self.messages.items()}, f)
+        os.replace(tmp_path, self.path)
+
+    @property
+    def active(self):
+        return bool(self.messages)
+
+    def _fragment(self, pubkey, name, online, rates, age):
+        key = (name, online, rates, age)
+        cached = self.fragments.get(pubkey)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        label = html.escape(name or f"{pubkey[:10]}…")
+        if online:
+            line = f"🟢 <b>{label}</b>"
+            if rates:
+                line += f" ⬇️ {rates[0]} ⬆️ {rates[1]}"
+        else:
+            line = f"⚪️ {label} — {age // 60} мин назад"
+        self.fragments[pubkey] = (key, line)
+        return line
+
+    def render_body(self, snapshot):
+        """Возвращает (текст сводки без строки времени обновления, состояние для хэша)"""
+        now = snapshot.taken_at
+        online = 0
+        total_rx = total_tx = 0.0
+        recent = []
+        for pubkey, peer in snapshot.by_key.items():
+            peer_online = is_online(peer, now)
+            rates = snapshot.rates.get(pubkey)
+            if rates:
+                total_rx += rates[0]
+                total_tx += rates[1]
+            if peer_online:
+                online += 1
+            handshake_ts = peer.get('handshake_ts')
+            if handshake_ts and now - handshake_ts <= RECENT_SECONDS:
+                recent.append((not peer_online, now - handshake_ts, pubkey, peer_online, rates))
+        recent.sort()
+        lines = [
+            "📟 <b>WireGuard</b>",
+            f"👥 Онлайн: <b>{online}</b> из {len(snapshot.by_key)}",
+            f"⚡️ Трафик: ⬇️ {format_rate(total_rx)} ⬆️ {format_rate(total_tx)}",
+        ]
+        state = [online, len(snapshot.by_key), rate_bucket(total_rx), rate_bucket(total_tx)]
+        if recent:
+            lines.append("\n<b>Недавно активные:</b>")
+            for _, age, pubkey, peer_online, rates in recent[:MAX_RECENT]:
+                shown_rates = (format_rate(rates[0]), format_rate(rates[1])) if peer_online and rates else None
+                shown_age = 0 if peer_online else int(age) // AGE_STEP * AGE_STEP
+                name = snapshot.names.get(pubkey)
+                lines.append(self._fragment(pubkey, name, peer_online, shown_rates, shown_age))
+                buckets = (rate_bucket(rates[0]), rate_bucket(rates[1])) if shown_rates else None
+                state.append((pubkey, name, peer_online, shown_age, buckets))
+        # Пиры, которых больше нет в интерфейсе, из кэша убираем
+        for pubkey in self.fragments.keys() - snapshot.by_key.keys():
+            del self.fragments[pubkey]
+        return '\n'.join(lines), tuple(state)
+
+    def render(self, snapshot):
+        """Возвращает (текст сообщения, хэш сводки)"""
+        with self.lock:
+            body, state = self.render_body(snapshot)
+        digest = hashlib.blake2b(repr(state).encode(), digest_size=16).digest()
+        stamp = time.strftime('%H:%M:%S', time.localtime(snapshot.taken_at))
+        return f"{body}\n\n<i>Обновлено {stamp}</i>", digest
+
+    async def attach(self, bot, chat_id, snapshot):
+        """Отправляет новую сводку в чат и закрепляет её вместо прежней"""
+        from telegram.constants import ParseMode
+        from telegram.error import TelegramError
+        text, digest = self.render(snapshot)
+        message = await bot.send_message(chat_id=chat_id, text=text, parse_mode=ParseMode.HTML)
+        try:
+            await bot.pin_chat_message(chat_id=chat_id, message_id=message.message_id, disable_notification=True)
+        except TelegramError as e:
+            logger.warning(f"Не удалось закрепить сводку в чате {chat_id}: {e}")
+        with self.lock:
+            self.messages[chat_id] = message.message_id
+            self.hashes[chat_id] = digest
+            self.last_edit[chat_id] = time.monotonic()
+            self._save()
+
+    def detach(self, chat_id):
+        with self.lock:
+            removed = self.messages.pop(chat_id, None)
+            self.hashes.pop(chat_id, None)
+            self.last_edit.pop(chat_id, None)
+            if removed is not None:
+                self._save()
+        return removed
+
+    async def refresh(self, bot, snapshot):
+        """Правит сводки во всех чатах, где текст изменился и не превышен лимит правок"""
+        from telegram.constants import ParseMode
+        from telegram.error import BadRequest, TelegramError
+        if not self.active:
+            return 0
+        text, digest = self.render(snapshot)
+        edited = 0
+        now = time.monotonic()
+        with self.lock:
+            due = [
+                (chat_id, message_id) for chat_id, message_id in self.messages.items()
+                if self.hashes.get(chat_id) != digest and now - self.last_edit.get(chat_id, 0) >= self.min_interval
+            ]
+        # Блокировку не держим во время запросов к Telegram
+        for chat_id, message_id in due:
+            try:
+                await bot.edit_message_text(
+                    text=text, chat_id=chat_id, message_id=message_id, parse_mode=ParseMode.HTML
+                )
+                edited += 1
+            except BadRequest as e:
+                if 'not modified' not in str(e).lower():
+                    # Сообщение удалено или недоступно — перестаём его обновлять
+                    logger.warning(f"Сводка в чате {chat_id} больше не обновляется: {e}")
+                    self.detach(chat_id)
+                    continue
+            except TelegramError as e:
+                logger.error(f"Ошибка обновления сводки в чате {chat_id}: {e}")
+                continue
+            with self.lock:
+                if chat_id in self.messages:
+                    self.hashes[chat_id] = digest
+                    self.last_edit[chat_id] = now
+        return edited
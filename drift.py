@@ -0,0 +1,154 @@
+import ipaddress
+import threading
+
+WG_INTERFACE = 'wg0'
+
+
+def normalize_ips(text):
+    """Множество сетей из списка AllowedIPs (`10.0.0.2, 10.0.0.3/32` и `10.0.0.2/32,10.0.0.3/32` совпадают)"""
+    networks = set()
+    for item in (text or '').split(','):
+        item = item.strip()
+        if not item or item == '(none)':
+            continue
+        try:
+            networks.add(str(ipaddress.ip_network(item, strict=False)))
+        except ValueError:
+            networks.add(item.lower())
+    return frozenset(networks)
+
+
+def config_allowed_ips(block):
+    for line in block:
+        key, _, value = line.partition('=')
+        if key.strip() == 'AllowedIPs':
+            return normalize_ips(value)
+    return frozenset()
+
+
+class DriftReport:
+    """Расхождения между wg0.conf, интерфейсом (`wg show`) и каталогом clients/.
+
+    config_only — пиры из wg0.conf, которых нет на интерфейсе; live_only —
+    пиры интерфейса, которых нет в wg0.conf; ips_mismatch — пиры, у которых
+    AllowedIPs в wg0.conf и на интерфейсе различаются; orphan_files — файлы
+    clients/<имя>.conf без пира `# Client: <имя>` в wg0.conf; missing_files —
+    имена клиентов из wg0.conf без файла. config_checked=False, если wg0.conf
+    прочитать не удалось, files_checked=False — если не удалось получить
+    список файлов (соответствующие расхождения тогда не проверялись).
+    """
+
+    def __init__(self, config_only=(), live_only=(), ips_mismatch=(), orphan_files=(), missing_files=(),
+                 config_checked=True, files_checked=True):
+        self.config_only = frozenset(config_only)
+        self.live_only = frozenset(live_only)
+        self.ips_mismatch = frozenset(ips_mismatch)
+        self.orphan_files = frozenset(orphan_files)
+        self.missing_files = frozenset(missing_files)
+        self.config_checked = config_checked
+        self.files_checked = files_checked
+
+    @property
+    def signature(self):
+        return self.config_only, self.live_only, self.ips_mismatch, self.orphan_files, self.missing_files
+
+    @property
+    def interface_drift(self):
+        """Есть ли расхождения, которые исправляет `wg syncconf`"""
+        return self.config_checked and bool(self.config_only or self.live_only or self.ips_mismatch)
+
+    @property
+    def can_remove_files(self):
+        """Можно ли удалять файлы без пира: оба источника прочитаны, и такие файлы есть"""
+        return self.config_checked and self.files_checked and bool(self.orphan_files)
+
+    def __bool__(self):
+        return any(self.signature)
+
+
+def build_report(snapshot, client_files, interface=WG_INTERFACE):
+    """Сравнивает индексы ключей трёх источников разностями множеств.
+
+    client_files — имена файлов каталога clients/ или None, если список
+    получить не удалось. Если не прочитан wg0.conf, сравнивать не с чем:
+    отчёт пуст и помечен config_checked=False.
+    """
+    if not snapshot.config_loaded:
+        return DriftReport(config_checked=False, files_checked=client_files is not None)
+    blocks = snapshot.config_blocks()
+    config_keys = blocks.keys()
+    live_keys = {pubkey for pubkey, peer in snapshot.by_key.items() if peer.get('interface') == interface}
+    ips_mismatch = {
+        pubkey for pubkey in config_keys & live_keys
+        if config_allowed_ips(blocks[pubkey]) != normalize_ips(snapshot.by_key[pubkey].get('allowed ips'))
+    }
+    report = DriftReport(config_keys - live_keys, live_keys - config_keys, ips_mismatch, files_checked=client_files is not None)
+    if client_files is not None:
+        file_names = {f[:-5] for f in client_files if f.endswith('.conf')}
+        config_names = {name for pubkey, name in snapshot.names.items() if pubkey in config_keys}
+        report.orphan_files = frozenset(file_names - config_names)
+        report.missing_files = frozenset(config_names - file_names)
+    return report
+
+
+class DriftDetector:
+    """Проверка расхождений на каждом опросе мониторинга.
+
+    Отчёт строится из уже снятого снимка и списка файлов, поэтому проверка
+    не выполняет дополнительных команд; для того же снимка и тех же файлов
+    возвращается прошлый отчёт. Оповещение отправляется, только когда набор
+    расхождений изменился и подтвердился на двух опросах подряд — так
+    промежуточное состояние во время удаления клиента не даёт ложных тревог.
+    Если источник прочитать не удалось, зависящие от него расхождения
+    берутся из прошлого отчёта, а не считаются исчезнувшими или новыми.
+    """
+
+    def __init__(self, interface=WG_INTERFACE):
+        self.interface = interface
+        self.lock = threading.Lock()
+        self.report = DriftReport()
+        self.snapshot = None
+        self.client_files = None
+        # Сигнатура, о которой уже оповестили, и сигнатура, ждущая подтверждения
+        self.alerted = self.report.signature
+        self.pending = None
+
+    def check(self, snapshot, client_files):
+        """Текущий отчёт о расхождениях"""
+        files = frozenset(client_files) if client_files is not None else None
+        with self.lock:
+            if snapshot is self.snapshot and files == self.client_files:
+                return self.report
+            report = build_report(snapshot, files, self.interface)
+            if not report.config_checked:
+                report.config_only = self.report.config_only
+                report.live_only = self.report.live_only
+                report.ips_mismatch = self.report.ips_mismatch
+            if not report.config_checked or not report.files_checked:
+                report.orphan_files = self.report.orphan_files
+                report.missing_files = self.report.missing_files
+            self.snapshot = snapshot
+            self.client_files = files
+            self.report = report
+            return report
+
+    def observe(self, snapshot, client_files):
+        """Проверяет расхождения и возвращает отчёт, если о нём нужно оповестить, иначе None"""
+        report = self.check(snapshot, client_files)
+        signature = report.signature
+        with self.lock:
+            if signature == self.alerted:
+                self.pending = None
+                return None
+            if signature != self.pending:
+                self.pending = signature
+                return None
+            self.pending = None
+            self.alerted = signature
+        return report
+
+    def acknowledge(self, report):
+        """Отмечает отчёт как уже показанный (например, после исправления через /drift)"""
+        with self.lock:
+            self.alerted = report.signature
+            self.pending = None
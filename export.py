@@ -0,0 +1,77 @@
+import csv
+import gzip
+import io
+import json
+import tempfile
+import time
+
+from search_index import peer_ips
+
+EXPORT_FIELDS = [
+    'name', 'public_key', 'interface', 'tunnel_ips', 'endpoint', 'country', 'asn', 'asn_org', 'latest_handshake',
+    'rx_bytes', 'tx_bytes', 'month_rx_bytes', 'month_tx_bytes', 'total_rx_bytes', 'total_tx_bytes',
+]
+FORMATS = ('csv', 'json')
+# Пока выгрузка меньше этого размера, она держится в памяти, дальше — во временном файле
+SPOOL_MAX_SIZE = 1024 * 1024
+
+
+def iter_peer_records(snapshot, get_totals=None, geoip=None):
+    """Выдаёт по одному словарю на пира: интерфейс + wg0.conf + накопленный трафик"""
+    pubkeys = list(snapshot.by_key)
+    # Пиры, которые есть только в wg0.conf, — в конце
+    pubkeys.extend(pubkey for pubkey in snapshot.names if pubkey not in snapshot.by_key)
+    for pubkey in pubkeys:
+        peer = snapshot.by_key.get(pubkey, {})
+        handshake_ts = peer.get('handshake_ts')
+        record = {
+            'name': snapshot.names.get(pubkey, ''),
+            'public_key': pubkey,
+            'interface': peer.get('interface', ''),
+            'tunnel_ips': ' '.join(peer_ips(snapshot, pubkey)),
+            'endpoint': peer.get('endpoint', ''),
+            'latest_handshake': time.strftime('%Y-%m-%dT%H:%M:%S%z', time.localtime(handshake_ts)) if handshake_ts else '',
+            'rx_bytes': peer.get('rx_bytes', 0),
+            'tx_bytes': peer.get('tx_bytes', 0),
+        }
+        info = geoip.lookup(record['endpoint']) if geoip else None
+        record['country'], _, record['asn'], record['asn_org'] = info or ('', None, '', '')
+        totals = get_totals(pubkey) if get_totals else {'month': (0, 0), 'total': (0, 0)}
+        record['month_rx_bytes'], record['month_tx_bytes'] = totals['month']
+        record['total_rx_bytes'], record['total_tx_bytes'] = totals['total']
+        yield record
+
+
+def iter_csv(records):
+    """Выдаёт CSV построчно, не накапливая весь текст"""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS)
+    writer.writeheader()
+    for record in records:
+        writer.writerow(record)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+def iter_ndjson(records):
+    for record in records:
+        yield json.dumps(record, ensure_ascii=False) + '\n'
+
+
+def write_export(records, fmt='csv', compress=False):
+    """Пишет выгрузку в SpooledTemporaryFile и возвращает (файл, имя файла) с позицией в начале"""
+    chunks = iter_csv(records) if fmt == 'csv' else iter_ndjson(records)
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+    filename = f"wg-peers-{time.strftime('%Y%m%d-%H%M%S')}.{'csv' if fmt == 'csv' else 'ndjson'}"
+    if compress:
+        with gzip.GzipFile(filename=filename, mode='wb', fileobj=spool) as out:
+            for chunk in chunks:
+                out.write(chunk.encode('utf-8'))
+        filename += '.gz'
+    else:
+        for chunk in chunks:
+            spool.write(chunk.encode('utf-8'))
+    spool.seek(0)
+    return spool, filename
@@ -0,0 +1,123 @@
+import ipaddress
+import logging
+import threading
+from functools import lru_cache
+
+try:
+    import maxminddb
+except ImportError:
+    maxminddb = None
+
+logger = logging.getLogger(__name__)
+
+# Сколько разных IP помнить; endpoint'ы клиентов меняются редко
+DEFAULT_CACHE_SIZE = 4096
+
+
+def endpoint_ip(endpoint):
+    """IP из endpoint вида `1.2.3.4:51820` или `[2001:db8::1]:51820`, None для (none) и мусора"""
+    if not endpoint or endpoint == '(none)':
+        return None
+    host = endpoint.rsplit(':', 1)[0] if endpoint.count(':') == 1 or endpoint.startswith('[') else endpoint
+    host = host.strip('[]')
+    try:
+        return ipaddress.ip_address(host)
+    except ValueError:
+        return None
+
+
+def country_flag(code):
+    if not code or len(code) != 2 or not code.isalpha():
+        return ''
+    return ''.join(chr(0x1F1E6 + ord(c) - ord('A')) for c in code.upper())
+
+
+class GeoIP:
+    """Определение страны и AS по endpoint'ам пиров из локальных баз MaxMind (.mmdb).
+
+    Запросов в сеть нет: используются файлы GeoLite2/GeoIP2 Country или City
+    и, опционально, ASN. Результаты запоминаются в LRU-кэше по IP, поэтому
+    на каждом опросе база читается только для новых адресов. Без пакета
+    maxminddb или без путей к базам обогащение просто отключено.
+    """
+
+    def __init__(self, country_path=None, asn_path=None, cache_size=DEFAULT_CACHE_SIZE):
+        self.country_db = self._open(country_path)
+        self.asn_db = self._open(asn_path)
+        self.lookup_ip = lru_cache(maxsize=cache_size)(self._lookup_ip)
+        self.lock = threading.Lock()
+        # pubkey -> последняя известная страна endpoint'а
+        self.countries = {}
+
+    @staticmethod
+    def _open(path):
+        if not path:
+            return None
+        if maxminddb is None:
+            logger.warning(f"Пакет maxminddb не установлен, база {path} не используется (pip install maxminddb)")
+            return None
+        try:
+            return maxminddb.open_database(path)
+        except (OSError, ValueError) as e:
+            logger.error(f"Не удалось открыть базу GeoIP {path}: {e}")
+            return None
+
+    @property
+    def enabled(self):
+        return self.country_db is not None or self.asn_db is not None
+
+    def _lookup_ip(self, ip):
+        """(код страны, название страны, номер AS, организация AS) для IP"""
+        code = country = asn = org = None
+        if self.country_db is not None:
+            record = self.country_db.get(ip) or {}
+            data = record.get('country') or record.get('registered_country') or {}
+            code = data.get('iso_code')
+            country = (data.get('names') or {}).get('en')
+        if self.asn_db is not None:
+            record = self.asn_db.get(ip) or {}
+            asn = record.get('autonomous_system_number')
+            org = record.get('autonomous_system_organization')
+        return code, country, asn, org
+
+    def lookup(self, endpoint):
+        """Данные о endpoint'е или None, если обогащение выключено или адрес локальный"""
+        if not self.enabled:
+            return None
+        ip = endpoint_ip(endpoint)
+        if ip is None or not ip.is_global:
+            return None
+        return self.lookup_ip(str(ip))
+
+    def describe(self, endpoint):
+        """Строка вида `🇩🇪 Germany, AS3320 Deutsche Telekom AG` или None"""
+        info = self.lookup(endpoint)
+        if info is None:
+            return None
+        code, country, asn, org = info
+        parts = []
+        if code:
+            parts.append(f"{country_flag(code)} {country or code}")
+        if asn:
+            parts.append(f"AS{asn} {org}" if org else f"AS{asn}")
+        return ', '.join(parts) or None
+
+    def country_changes(self, snapshot):
+        """Возвращает [(pubkey, старая страна, новая страна)] для пиров, сменивших страну endpoint'а.
+
+        Первое наблюдение пира только запоминается, поэтому после запуска
+        бота ложных оповещений нет.
+        """
+        if self.country_db is None:
+            return []
+        changes = []
+        with self.lock:
+            for pubkey, peer in snapshot.by_key.items():
+                info = self.lookup(peer.get('endpoint'))
+                if info is None or not info[0]:
+                    continue
+                old = self.countries.get(pubkey)
+                if old is not None and old != info[0]:
+                    changes.append((pubkey, old, info[0]))
+                self.countries[pubkey] = info[0]
+        return changes
@@ -0,0 +1,173 @@
+import logging
+import sqlite3
+import threading
+import time
+
+from wg_show import is_online
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HISTORY_PATH = 'wg_history.sqlite3'
+DEFAULT_RETENTION_DAYS = 180
+# Как часто удалять события старше срока хранения
+COMPACT_INTERVAL = 24 * 3600
+
+PEER_ADDED = 1
+PEER_REMOVED = 2
+PEER_ONLINE = 3
+PEER_OFFLINE = 4
+ENDPOINT_CHANGED = 5
+PEER_DELETED = 6
+
+EVENT_NAMES = {
+    PEER_ADDED: "➕ добавлен",
+    PEER_REMOVED: "➖ пропал из интерфейса",
+    PEER_ONLINE: "🟢 онлайн",
+    PEER_OFFLINE: "⚪️ офлайн",
+    ENDPOINT_CHANGED: "📍 сменил endpoint",
+    PEER_DELETED: "🗑 удалён через бота",
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS peers (
+    id INTEGER PRIMARY KEY,
+    pubkey TEXT UNIQUE,
+    name TEXT
+);
+CREATE INDEX IF NOT EXISTS peers_name ON peers (name COLLATE NOCASE);
+CREATE TABLE IF NOT EXISTS events (
+    peer_id INTEGER NOT NULL,
+    ts INTEGER NOT NULL,
+    kind INTEGER NOT NULL,
+    detail TEXT
+);
+CREATE INDEX IF NOT EXISTS events_peer_ts ON events (peer_id, ts);
+CREATE INDEX IF NOT EXISTS events_ts ON events (ts);
+CREATE TABLE IF NOT EXISTS peer_state (
+    peer_id INTEGER PRIMARY KEY,
+    present INTEGER NOT NULL,
+    online INTEGER NOT NULL,
+    endpoint TEXT
+) WITHOUT ROWID;
+"""
+
+
+class SessionHistory:
+    """Журнал событий пиров в SQLite.
+
+    События пишутся только при изменениях (появление/исчезновение пира,
+    переходы онлайн/офлайн, смена endpoint, удаление через бота), ключи
+    пиров хранятся один раз в таблице peers, а запросы /history идут по
+    индексу (peer_id, ts) без просмотра всего журнала. Последнее известное
+    состояние пиров сохраняется, поэтому после перезапуска бота не
+    появляются ложные события.
+    """
+
+    def __init__(self, path=DEFAULT_HISTORY_PATH, retention_days=DEFAULT_RETENTION_DAYS):
+        self.path = path
+        self.retention = retention_days * 24 * 3600
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        self.db.execute("PRAGMA journal_mode = WAL")
+        self.db.executescript(SCHEMA)
+        self.peer_ids = {}
+        self.peer_names = {}
+        for peer_id, pubkey, name in self.db.execute("SELECT id, pubkey, name FROM peers"):
+            self.peer_ids[pubkey] = peer_id
+            self.peer_names[peer_id] = name
+        self.state = {
+            peer_id: (bool(present), bool(online), endpoint)
+            for peer_id, present, online, endpoint in self.db.execute("SELECT * FROM peer_state")
+        }
+        self.last_compact = 0
+
+    def _peer_id(self, pubkey, name=None):
+        peer_id = self.peer_ids.get(pubkey)
+        if peer_id is None:
+            peer_id = self.db.execute("INSERT INTO peers (pubkey, name) VALUES (?, ?)", (pubkey, name)).lastrowid
+            self.peer_ids[pubkey] = peer_id
+            self.peer_names[peer_id] = name
+        elif name and self.peer_names.get(peer_id) != name:
+            self.db.execute("UPDATE peers SET name = ? WHERE id = ?", (name, peer_id))
+            self.peer_names[peer_id] = name
+        return peer_id
+
+    def record_snapshot(self, snapshot):
+        """Сравнивает снимок с последним состоянием и записывает изменения одной транзакцией"""
+        now = int(snapshot.taken_at)
+        events = []
+        new_state = {}
+        with self.lock, self.db:
+            for pubkey, peer in snapshot.by_key.items():
+                peer_id = self._peer_id(pubkey, snapshot.names.get(pubkey))
+                online = is_online(peer, snapshot.taken_at)
+                endpoint = peer.get('endpoint')
+                present, was_online, old_endpoint = self.state.get(peer_id, (False, False, None))
+                if not present:
+                    events.append((peer_id, now, PEER_ADDED, endpoint))
+                if online != was_online:
+                    events.append((peer_id, now, PEER_ONLINE if online else PEER_OFFLINE, endpoint))
+                if endpoint and old_endpoint and endpoint != old_endpoint:
+                    events.append((peer_id, now, ENDPOINT_CHANGED, f"{old_endpoint} → {endpoint}"))
+                state = (True, online, endpoint or old_endpoint)
+                if state != self.state.get(peer_id):
+                    new_state[peer_id] = state
+            live_ids = {self.peer_ids[pubkey] for pubkey in snapshot.by_key}
+            for peer_id, (present, _, endpoint) in self.state.items():
+                if present and peer_id not in live_ids:
+                    events.append((peer_id, now, PEER_REMOVED, None))
+                    new_state[peer_id] = (False, False, endpoint)
+            if events:
+                self.db.executemany("INSERT INTO events (peer_id, ts, kind, detail) VALUES (?, ?, ?, ?)", events)
+            if new_state:
+                self.db.executemany(
+                    "INSERT OR REPLACE INTO peer_state (peer_id, present, online, endpoint) VALUES (?, ?, ?, ?)",
+                    [(peer_id, int(p), int(o), e) for peer_id, (p, o, e) in new_state.items()]
+                )
+                self.state.update(new_state)
+        if time.time() - self.last_compact > COMPACT_INTERVAL:
+            self.compact()
+        return len(events)
+
+    def record_deleted(self, name, pubkey=None):
+        """Записывает удаление клиента через бота"""
+        with self.lock, self.db:
+            if pubkey is None:
+                row = self.db.execute(
+                    "SELECT pubkey FROM peers WHERE name = ? COLLATE NOCASE ORDER BY id DESC LIMIT 1", (name,)
+                ).fetchone()
+                pubkey = row[0] if row else f"name:{name}"
+            peer_id = self._peer_id(pubkey, name)
+            self.db.execute(
+                "INSERT INTO events (peer_id, ts, kind, detail) VALUES (?, ?, ?, ?)",
+                (peer_id, int(time.time()), PEER_DELETED, name)
+            )
+
+    def compact(self, now=None):
+        """Удаляет события старше срока хранения и возвращает место на диске"""
+        now = now or time.time()
+        with self.lock, self.db:
+            removed = self.db.execute("DELETE FROM events WHERE ts < ?", (int(now - self.retention),)).rowcount
+        with self.lock:
+            self.db.execute("PRAGMA incremental_vacuum")
+        self.last_compact = now
+        if removed:
+            logger.info(f"История: удалено {removed} старых событий")
+        return removed
+
+    def query(self, name_or_key, limit=30):
+        """Последние события пира по имени клиента или публичному ключу (новые первыми)"""
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT id, name FROM peers WHERE pubkey = ? OR name = ? COLLATE NOCASE",
+                (name_or_key, name_or_key)
+            ).fetchall()
+            if not rows:
+                return []
+            ids = [row[0] for row in rows]
+            placeholders = ','.join('?' * len(ids))
+            return self.db.execute(
+                f"SELECT ts, kind, detail FROM events WHERE peer_id IN ({placeholders}) ORDER BY ts DESC, rowid DESC LIMIT ?",
+                (*ids, limit)
+            ).fetchall()
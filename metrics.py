@@ -0,0 +1,200 @@
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from wg_show import is_online
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+# По умолчанию /metrics слушает только localhost: метрики содержат ключи, имена и endpoint'ы клиентов
+DEFAULT_METRICS_ADDR = '127.0.0.1'
+
+# (имя метрики, тип, описание) — порядок определяет порядок вывода
+PEER_FAMILIES = [
+    ('wireguard_peer_receive_bytes_total', 'counter', 'Bytes received from the peer'),
+    ('wireguard_peer_transmit_bytes_total', 'counter', 'Bytes sent to the peer'),
+    ('wireguard_peer_latest_handshake_seconds', 'gauge', 'UNIX timestamp of the latest handshake'),
+]
+INTERFACE_FAMILIES = [
+    ('wireguard_peers_online', 'gauge', 'Peers with a handshake in the last 180 seconds'),
+    ('wireguard_peers', 'gauge', 'Peers configured on the interface'),
+]
+SCALAR_FAMILIES = [
+    ('wireguard_poll_duration_seconds', 'gauge', 'Duration of the latest monitoring poll'),
+    ('wireguard_polls_total', 'counter', 'Monitoring polls performed'),
+    ('wireguard_ssh_rtt_seconds', 'gauge', 'Round-trip time of the latest SSH command'),
+    ('telegram_send_failures_total', 'counter', 'Telegram messages that failed to send'),
+]
+
+
+def escape_label(value):
+    """Экранирует значение метки по правилам текстового формата Prometheus"""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_value(value):
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+class MetricsExporter:
+    """Метрики WireGuard в текстовом формате Prometheus.
+
+    Данные берутся из снимка, который уже собрал мониторинг, поэтому запрос
+    /metrics не вызывает `wg show`. Строки меток каждого пира вычисляются один
+    раз, строки сэмплов пересобираются только у изменившихся пиров, а готовый
+    ответ кэшируется до следующего изменения.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.peer_labels = {}
+        # имя метрики -> {ключ серии: готовая строка сэмпла}
+        self.samples = {name: {} for name, _, _ in PEER_FAMILIES + INTERFACE_FAMILIES + SCALAR_FAMILIES}
+        self.peer_values = {}
+        self.counters = {}
+        self.body = None
+        self.server = None
+
+    def _peer_label(self, interface, pubkey, name):
+        cache_key = (interface, pubkey, name)
+        labels = self.peer_labels.get(cache_key)
+        if labels is None:
+            labels = (
+                f'{{interface="{escape_label(interface)}",public_key="{escape_label(pubkey)}"'
+                f',name="{escape_label(name or "")}"}}'
+            )
+            self.peer_labels[cache_key] = labels
+        return labels
+
+    def _set(self, family, key, labels, value):
+        """Записывает строку сэмпла и возвращает True, если она изменилась"""
+        line = f"{family}{labels} {format_value(value)}"
+        if self.samples[family].get(key) == line:
+            return False
+        self.samples[family][key] = line
+        return True
+
+    def update_peers(self, peers, names=None, now=None):
+        """Обновляет метрики пиров по снимку `wg show all dump`"""
+        if now is None:
+            now = time.time()
+        names = names or {}
+        seen = set()
+        online = {}
+        totals = {}
+        with self.lock:
+            changed = False
+            for peer in peers:
+                pubkey = peer.get('peer')
+                if not pubkey:
+                    continue
+                interface = peer.get('interface', 'wg0')
+                key = (interface, pubkey)
+                seen.add(key)
+                totals[interface] = totals.get(interface, 0) + 1
+                if is_online(peer, now):
+                    online[interface] = online.get(interface, 0) + 1
+                # Время handshake, а не его возраст: возраст менялся бы на каждом опросе
+                handshake_ts = peer.get('handshake_ts') or None
+                values = (names.get(pubkey), peer.get('rx_bytes', 0), peer.get('tx_bytes', 0), handshake_ts)
+                if self.peer_values.get(key) == values:
+                    continue
+                changed = True
+                old = self.peer_values.get(key)
+                if old is not None and old[0] != values[0]:
+                    self.peer_labels.pop((interface, pubkey, old[0]), None)
+                self.peer_values[key] = values
+                labels = self._peer_label(interface, pubkey, values[0])
+                self._set('wireguard_peer_receive_bytes_total', key, labels, values[1])
+                self._set('wireguard_peer_transmit_bytes_total', key, labels, values[2])
+                if handshake_ts is None:
+                    self.samples['wireguard_peer_latest_handshake_seconds'].pop(key, None)
+                else:
+                    self._set('wireguard_peer_latest_handshake_seconds', key, labels, handshake_ts)
+            for key in list(self.peer_values):
+                if key not in seen:
+                    changed = True
+                    name = self.peer_values.pop(key)[0]
+                    self.peer_labels.pop((key[0], key[1], name), None)
+                    for family, _, _ in PEER_FAMILIES:
+                        self.samples[family].pop(key, None)
+            for interface in set(totals) | set(self.samples['wireguard_peers']):
+                labels = f'{{interface="{escape_label(interface)}"}}'
+                if interface in totals:
+                    changed |= self._set('wireguard_peers', interface, labels, totals[interface])
+                    changed |= self._set('wireguard_peers_online', interface, labels, online.get(interface, 0))
+                else:
+                    self.samples['wireguard_peers'].pop(interface, None)
+                    self.samples['wireguard_peers_online'].pop(interface, None)
+                    changed = True
+            if changed:
+                self.body = None
+
+    def _set_scalar(self, family, value):
+        with self.lock:
+            self._set(family, None, '', value)
+            self.body = None
+
+    def _inc_scalar(self, family, amount=1):
+        with self.lock:
+            self.counters[family] = self.counters.get(family, 0) + amount
+            self._set(family, None, '', self.counters[family])
+            self.body = None
+
+    def observe_poll(self, seconds):
+        self._set_scalar('wireguard_poll_duration_seconds', round(seconds, 6))
+        self._inc_scalar('wireguard_polls_total')
+
+    def observe_ssh_rtt(self, seconds):
+        self._set_scalar('wireguard_ssh_rtt_seconds', round(seconds, 6))
+
+    def inc_telegram_send_failures(self):
+        self._inc_scalar('telegram_send_failures_total')
+
+    def render(self):
+        """Возвращает тело ответа /metrics (bytes), пересобирая его только после изменений"""
+        with self.lock:
+            if self.body is None:
+                parts = []
+                for name, kind, help_text in PEER_FAMILIES + INTERFACE_FAMILIES + SCALAR_FAMILIES:
+                    samples = self.samples[name]
+                    if not samples:
+                        continue
+                    parts.append(f"# HELP {name} {help_text}\n# TYPE {name} {kind}\n")
+                    parts.append('\n'.join(samples.values()))
+                    parts.append('\n')
+                self.body = ''.join(parts).encode('utf-8')
+            return self.body
+
+    def start(self, port, addr=DEFAULT_METRICS_ADDR):
+        """Запускает HTTP сервер /metrics в фоновом потоке"""
+        exporter = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?', 1)[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = exporter.render()
+                self.send_response(200)
+                self.send_header('Content-Type', CONTENT_TYPE)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        try:
+            self.server = ThreadingHTTPServer((addr, port), Handler)
+        except OSError as e:
+            logger.error(f"Не удалось запустить сервер метрик на {addr}:{port}: {e}")
+            return False
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        logger.info(f"Метрики Prometheus доступны на http://{addr}:{port}/metrics")
+        return True
@@ -0,0 +1,184 @@
+import bisect
+import collections
+import contextlib
+import sys
+import threading
+import time
+
+# Границы корзин гистограммы в секундах: от 0.1 мс до ~100 с с шагом ×1.25
+BUCKET_BOUNDS = []
+_bound = 0.0001
+while _bound < 100:
+    BUCKET_BOUNDS.append(_bound)
+    _bound *= 1.25
+del _bound
+
+RECENT_CALLS = 256
+
+
+class LatencyHistogram:
+    """Гистограмма задержек фиксированного размера (логарифмические корзины)"""
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKET_BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(BUCKET_BOUNDS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, q):
+        """Возвращает верхнюю границу корзины, в которую попадает q-й перцентиль"""
+        if not self.count:
+            return 0.0
+        rank = q / 100 * self.count
+        seen = 0
+        for i, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= rank:
+                return min(BUCKET_BOUNDS[i], self.max) if i < len(BUCKET_BOUNDS) else self.max
+        return self.max
+
+
+class PerfRecorder:
+    """Собирает длительности операций по именам и хранит последние вызовы"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.recent = collections.deque(maxlen=RECENT_CALLS)
+
+    def record(self, operation, seconds, detail=''):
+        with self.lock:
+            histogram = self.histograms.get(operation)
+            if histogram is None:
+                histogram = self.histograms[operation] = LatencyHistogram()
+            histogram.observe(seconds)
+            self.recent.append((seconds, operation, detail, time.time()))
+
+    @contextlib.contextmanager
+    def span(self, operation, detail=''):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(operation, time.perf_counter() - started, detail)
+
+    def summary(self):
+        """Возвращает [(операция, count, p50, p95, p99, max)], отсортированные по p99"""
+        with self.lock:
+            rows = [
+                (name, h.count, h.percentile(50), h.percentile(95), h.percentile(99), h.max)
+                for name, h in self.histograms.items()
+            ]
+        return sorted(rows, key=lambda row: row[4], reverse=True)
+
+    def slowest(self, limit=5):
+        with self.lock:
+            recent = list(self.recent)
+        return sorted(recent, reverse=True)[:limit]
+
+    def format_report(self):
+        """Текст для команды /perf"""
+        rows = self.summary()
+        if not rows:
+            return "Нет данных о производительности."
+        lines = [f"{'операция':<22} {'n':>6} {'p50':>8} {'p95':>8} {'p99':>8}"]
+        for name, count, p50, p95, p99, _ in rows:
+            lines.append(f"{name[:22]:<22} {count:>6} {format_ms(p50):>8} {format_ms(p95):>8} {format_ms(p99):>8}")
+        lines.append("")
+        lines.append("Самые медленные недавние вызовы:")
+        for seconds, name, detail, at in self.slowest():
+            stamp = time.strftime('%H:%M:%S', time.localtime(at))
+            lines.append(f"{stamp} {format_ms(seconds):>8} {name} {detail[:40]}")
+        return '\n'.join(lines)
+
+
+def format_ms(seconds):
+    return f"{seconds * 1000:.1f}ms"
+
+
+class SamplingProfiler:
+    """Сэмплирующий профайлер всех потоков процесса.
+
+    Результат выдаётся в формате «collapsed stacks» (frame;frame;frame count),
+    который понимают flamegraph.pl и speedscope.
+    """
+
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.stacks = collections.Counter()
+        self.thread = None
+        self.stop_event = threading.Event()
+
+    @property
+    def running(self):
+        return self.thread is not None
+
+    def start(self):
+        if self.running:
+            return False
+        self.stacks.clear()
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._sample_loop, daemon=True)
+        self.thread.start()
+        return True
+
+    def stop(self):
+        """Останавливает профайлер и возвращает профиль в формате collapsed stacks"""
+        if not self.running:
+            return ''
+        self.stop_event.set()
+        self.thread.join()
+        self.thread = None
+        return '\n'.join(f"{stack} {count}" for stack, count in self.stacks.most_common()) + '\n'
+
+    def _sample_loop(self):
+        own_id = threading.get_ident()
+        names = {}
+        while not self.stop_event.wait(self.interval):
+            for thread in threading.enumerate():
+                names[thread.ident] = thread.name
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                self.stacks[';'.join(reversed(stack))] += 1
+
+
+recorder = PerfRecorder()
+span = recorder.span
+profiler = SamplingProfiler()
+
+
+# Размер пула соединений, который ApplicationBuilder использует для обычных запросов
+# (у самого HTTPXRequest по умолчанию 1 — все вызовы Bot API шли бы по очереди)
+TELEGRAM_CONNECTION_POOL_SIZE = 256
+
+
+def timed_telegram_request(**kwargs):
+    """HTTPXRequest, который записывает длительность каждого вызова Telegram Bot API.
+
+    Параметры по умолчанию совпадают с теми, что ApplicationBuilder задаёт сам,
+    если свой request не передан.
+    """
+    from telegram.request import HTTPXRequest
+
+    kwargs.setdefault('connection_pool_size', TELEGRAM_CONNECTION_POOL_SIZE)
+
+    class TimedHTTPXRequest(HTTPXRequest):
+        async def do_request(self, url, method, *args, **kw):
+            with span('telegram.' + url.rsplit('/', 1)[-1]):
+                return await super().do_request(url, method, *args, **kw)
+
+    return TimedHTTPXRequest(**kwargs)
@@ -0,0 +1,134 @@
+import codecs
+import select
+
+CHUNK_SIZE = 32768
+# Ограничения на объём вывода одной команды
+MAX_OUTPUT_BYTES = 16 * 1024 * 1024
+MAX_STDERR_BYTES = 64 * 1024
+
+
+class OutputLimitExceeded(Exception):
+    """Команда вывела больше данных, чем разрешено"""
+
+
+class RemoteCommand:
+    """Потоковое выполнение команды по SSH.
+
+    stdout и stderr читаются одновременно из одного канала, поэтому команда,
+    которая много пишет в stderr, не зависнет на заполненном окне канала.
+    Вывод отдаётся по мере поступления: байтами через chunks()/stream()
+    или построчно через lines(); после исчерпания вывода доступны stderr
+    и exit_status.
+    """
+
+    def __init__(self, client, command, max_bytes=MAX_OUTPUT_BYTES, timeout=None):
+        self.command = command
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self.channel = client.get_transport().open_session()
+        self.channel.exec_command(command)
+        self.stderr = ''
+        self.exit_status = None
+
+    def send(self, data):
+        """Передаёт данные на stdin команды и закрывает его"""
+        self.channel.sendall(data)
+        self.channel.shutdown_write()
+
+    def chunks(self):
+        """Выдаёт байты stdout по мере их поступления"""
+        channel = self.channel
+        err_decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        stderr_parts = []
+        stderr_size = 0
+        received = 0
+        try:
+            while True:
+                progressed = False
+                if channel.recv_ready():
+                    data = channel.recv(CHUNK_SIZE)
+                    progressed = True
+                    received += len(data)
+                    if received > self.max_bytes:
+                        raise OutputLimitExceeded(
+                            f"вывод команды превысил {self.max_bytes} байт: {self.command}"
+                        )
+                    if data:
+                        yield data
+                if channel.recv_stderr_ready():
+                    data = channel.recv_stderr(CHUNK_SIZE)
+                    progressed = True
+                    if stderr_size < MAX_STDERR_BYTES:
+                        stderr_parts.append(err_decoder.decode(data[:MAX_STDERR_BYTES - stderr_size]))
+                    stderr_size += len(data)
+                if progressed:
+                    continue
+                if channel.exit_status_ready() and not channel.recv_ready() and not channel.recv_stderr_ready():
+                    break
+                readable, _, _ = select.select([channel], [], [], self.timeout)
+                if not readable and self.timeout is not None:
+                    raise TimeoutError(f"команда не ответила за {self.timeout} с: {self.command}")
+            self.exit_status = channel.recv_exit_status()
+        finally:
+            self.stderr = ''.join(stderr_parts) + err_decoder.decode(b'', final=True)
+            channel.close()
+
+    def lines(self, keepends=False):
+        """Выдаёт строки stdout по мере их поступления"""
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        pending = ''
+        for data in self.chunks():
+            pending += decoder.decode(data)
+            if '\n' in pending:
+                *complete, pending = pending.split('\n')
+                for line in complete:
+                    yield line + '\n' if keepends else line
+        pending += decoder.decode(b'', final=True)
+        if pending:
+            yield pending
+
+    def stream(self):
+        """stdout как файловый объект для чтения байтов (read/readline)"""
+        return _ChunkStream(self.chunks())
+
+    def read(self):
+        """Выполняет команду целиком и возвращает (stdout, stderr)"""
+        output = ''.join(self.lines(keepends=True))
+        return output, self.stderr
+
+
+class _ChunkStream:
+    """Файловый объект поверх генератора байтов"""
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.buffer = b''
+        self.eof = False
+
+    def _fill(self):
+        if self.eof:
+            return False
+        try:
+            self.buffer += next(self.chunks)
+        except StopIteration:
+            self.eof = True
+            return False
+        return True
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            while self._fill():
+                pass
+            size = len(self.buffer)
+        else:
+            while len(self.buffer) < size and self._fill():
+                pass
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+    def readline(self):
+        while b'\n' not in self.buffer and self._fill():
+            pass
+        end = self.buffer.find(b'\n') + 1 or len(self.buffer)
+        data, self.buffer = self.buffer[:end], self.buffer[end:]
+        return data
@@ -1,17 +1,129 @@
 #!/usr/bin/env python3
 """
-Скрипт для запуска WireGuard Telegram бота
+Единая точка запуска WireGuard Telegram бота.
+
+Режим выбирается по конфигурации (BOT_MODE=local|ssh, по умолчанию ssh, если
+указан SSH_HOST, иначе local). Первый снимок `wg show all dump` запускается в
+фоне ещё до импорта telegram и модуля бота и попадает в кэш снимков бота,
+поэтому к первому нажатию кнопки данные уже готовы. paramiko импортируется только в режиме ssh.
 """
 
+import importlib.util
+import os
 import sys
+import time
 import traceback
-from bot import WireGuardBot
+from concurrent.futures import ThreadPoolExecutor
+
+from config import load_config
+from metrics import DEFAULT_METRICS_ADDR
+from webhook import webhook_settings
+
+WG0_CONF_PATH = '/etc/wireguard/wg0.conf'
+
+BOT_MODULES = {
+    'local': 'bot.py',
+    'ssh': 'bot-ssh.py',
+}
+
+
+def detect_mode(config):
+    """Определяет режим работы бота по конфигурации"""
+    mode = config.get('BOT_MODE')
+    if mode:
+        return mode.lower()
+    return 'ssh' if config.get('SSH_HOST') else 'local'
+
+
+def fetch_snapshot(mode, config):
+    """Выполняет первый `wg show all dump` без импорта telegram"""
+    from wg_show import WG_DUMP_COMMAND, WgSnapshot, parse_wg_dump
+    if mode == 'ssh':
+        from wireguard_manager import WireGuardManager
+        manager = WireGuardManager(
+            config['SSH_HOST'], config.get('SSH_PORT', 22),
+            config['SSH_USERNAME'], config.get('SSH_PASSWORD')
+        )
+        rows = list(parse_wg_dump(manager.execute_command_lines(WG_DUMP_COMMAND)))
+        wg0_lines = manager.read_remote_file(WG0_CONF_PATH)
+        ssh_client = manager.ssh_client
+    else:
+        import subprocess
+        output = subprocess.run(WG_DUMP_COMMAND.split(), capture_output=True, text=True).stdout
+        rows = list(parse_wg_dump(output.splitlines()))
+        try:
+            with open(WG0_CONF_PATH, 'r') as f:
+                wg0_lines = f.readlines()
+        except OSError:
+            wg0_lines = None
+        ssh_client = None
+    if not rows:
+        raise RuntimeError("пустой вывод wg show all dump")
+    return {'snapshot': WgSnapshot(rows, wg0_lines), 'ssh_client': ssh_client}
+
+
+def load_bot_module(mode):
+    """Импортирует модуль бота для выбранного режима (bot-ssh.py нельзя импортировать обычным import)"""
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), BOT_MODULES[mode])
+    spec = importlib.util.spec_from_file_location(f"wg_bot_{mode}", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def create_bot(module, mode, config, prefetch):
+    metrics = (config.get("METRICS_PORT"), config.get("METRICS_ADDR", DEFAULT_METRICS_ADDR))
+    options = {'prefetch': prefetch}
+    if config.get("SNAPSHOT_TTL") is not None:
+        options['snapshot_ttl'] = config["SNAPSHOT_TTL"]
+    if config.get("HISTORY_DB"):
+        options['history_path'] = config["HISTORY_DB"]
+    if config.get("TRAFFIC_DB"):
+        options['traffic_path'] = config["TRAFFIC_DB"]
+    if config.get("ADMINS"):
+        options['admins'] = config["ADMINS"]
+    if config.get("DASHBOARD_FILE"):
+        options['dashboard_path'] = config["DASHBOARD_FILE"]
+    if config.get("GEOIP_DB"):
+        options['geoip_path'] = config["GEOIP_DB"]
+    if config.get("GEOIP_ASN_DB"):
+        options['geoip_asn_path'] = config["GEOIP_ASN_DB"]
+    if mode == 'ssh' and config.get("CLIENTS_MIRROR"):
+        options['mirror_path'] = config["CLIENTS_MIRROR"]
+    if config.get("REVISIONS_DB"):
+        options['revisions_path'] = config["REVISIONS_DB"]
+    if config.get("TELEGRAM_API_URL"):
+        options['api_url'] = config["TELEGRAM_API_URL"]
+    options['webhook_config'] = webhook_settings(config)
+    if mode == 'ssh':
+        return module.WireGuardBot(
+            config["BOT_TOKEN"], config["CHAT_ID"],
+            config["SSH_HOST"], config.get("SSH_PORT", 22),
+            config["SSH_USERNAME"], config.get("SSH_PASSWORD"),
+            *metrics, **options
+        )
+    return module.WireGuardBot(config["BOT_TOKEN"], config["CHAT_ID"], *metrics, **options)
+
 
 def main():
     """Основная функция запуска бота"""
+    started = time.monotonic()
     try:
-        print("🚀 Запуск WireGuard Telegram Bot...")
-        bot = WireGuardBot()
+        config = load_config()
+        if not config:
+            print("❌ Не удалось загрузить конфигурацию из api_token.txt")
+            sys.exit(1)
+        mode = detect_mode(config)
+        if mode not in BOT_MODULES:
+            print(f"❌ Неизвестный режим BOT_MODE={mode}. Доступны: {', '.join(BOT_MODULES)}")
+            sys.exit(1)
+        print(f"🚀 Запуск WireGuard Telegram Bot (режим: {mode})...")
+        executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='wg-prefetch')
+        prefetch = executor.submit(fetch_snapshot, mode, config)
+        executor.shutdown(wait=False)
+        module = load_bot_module(mode)
+        bot = create_bot(module, mode, config, prefetch)
+        print(f"⚡ Бот инициализирован за {time.monotonic() - started:.2f} с")
         bot.run()
     except KeyboardInterrupt:
         print("\n⏹ Бот остановлен пользователем")
@@ -22,4 +134,4 @@ def main():
         sys.exit(1)
 
 if __name__ == '__main__':
-    main() 
\ No newline at end of file
+    main()
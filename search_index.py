@@ -0,0 +1,144 @@
+import bisect
+import heapq
+import threading
+from collections import defaultdict
+
+GRAM = 3
+# Префикс doc_id для клиентов, у которых есть файл в clients/, но нет пира в wg0.conf
+FILE_DOC_PREFIX = 'file:'
+
+
+def trigrams(text):
+    return {text[i:i + GRAM] for i in range(len(text) - GRAM + 1)}
+
+
+def peer_ips(snapshot, pubkey):
+    """Туннельные IP пира (без маски) из интерфейса или блока wg0.conf"""
+    peer = snapshot.by_key.get(pubkey)
+    allowed = peer.get('allowed ips', '') if peer else ''
+    if not allowed or allowed == '(none)':
+        for line in snapshot.config_block(pubkey):
+            key, _, value = line.partition('=')
+            if key.strip() == 'AllowedIPs':
+                allowed = value
+                break
+    return tuple(ip.strip().split('/', 1)[0] for ip in allowed.split(',') if ip.strip() and ip.strip() != '(none)')
+
+
+class ClientIndex:
+    """Поисковый индекс клиентов по имени, публичному ключу и туннельным IP.
+
+    Подстроки длиной от трёх символов ищутся по индексу триграмм: берётся
+    пересечение списков документов по триграммам запроса (от самого
+    короткого) и кандидаты проверяются на вхождение. Более короткие запросы
+    ищутся как префиксы двоичным поиском по отсортированному списку полей.
+    Индекс обновляется по разнице документов, поэтому при очередном снимке
+    переиндексируются только изменившиеся клиенты.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # doc_id -> (имя, pubkey, ips)
+        self.docs = {}
+        # doc_id -> поля документа в нижнем регистре
+        self.fields = {}
+        self.grams = defaultdict(set)
+        # отсортированный список (значение поля в нижнем регистре, doc_id)
+        self.prefixes = []
+        self.snapshot = None
+        self.client_files = set()
+
+    @staticmethod
+    def _fields(doc):
+        name, pubkey, ips = doc
+        fields = [ip for ip in ips]
+        if name:
+            fields.append(name.lower())
+        if pubkey:
+            fields.append(pubkey.lower())
+        return fields
+
+    def _add(self, doc_id, doc):
+        self.docs[doc_id] = doc
+        fields = self.fields[doc_id] = self._fields(doc)
+        for field in fields:
+            for gram in trigrams(field):
+                self.grams[gram].add(doc_id)
+            self.prefixes.append((field, doc_id))
+
+    def _remove(self, doc_id):
+        del self.docs[doc_id]
+        for field in self.fields.pop(doc_id):
+            for gram in trigrams(field):
+                posting = self.grams.get(gram)
+                if posting is not None:
+                    posting.discard(doc_id)
+                    if not posting:
+                        del self.grams[gram]
+            i = bisect.bisect_left(self.prefixes, (field, doc_id))
+            if i < len(self.prefixes) and self.prefixes[i] == (field, doc_id):
+                del self.prefixes[i]
+
+    def update(self, docs):
+        """Приводит индекс к набору документов doc_id -> (имя, pubkey, ips), возвращает число изменений"""
+        with self.lock:
+            stale = self.docs.keys() - docs.keys()
+            fresh = {doc_id: doc for doc_id, doc in docs.items() if self.docs.get(doc_id) != doc}
+            # Сначала удаления — пока список префиксов отсортирован, поля находятся двоичным поиском
+            for doc_id in stale | (fresh.keys() & self.docs.keys()):
+                self._remove(doc_id)
+            for doc_id, doc in fresh.items():
+                self._add(doc_id, doc)
+            if fresh:
+                # новые поля дописаны в конец, почти отсортированный список сортируется быстро
+                self.prefixes.sort()
+        return len(stale) + len(fresh)
+
+    def update_from_snapshot(self, snapshot, client_files=None):
+        """Обновляет индекс по снимку и списку файлов каталога clients/.
+
+        client_files=None — список не получен (или не запрашивался): клиенты
+        из файлов берутся из прошлого обновления, а не удаляются из индекса.
+        """
+        if client_files is not None:
+            self.client_files = {f[:-5] if f.endswith('.conf') else f for f in client_files}
+        elif snapshot is self.snapshot:
+            return 0
+        self.snapshot = snapshot
+        docs = {}
+        for pubkey in snapshot.by_key.keys() | snapshot.names.keys():
+            docs[pubkey] = (snapshot.names.get(pubkey), pubkey, peer_ips(snapshot, pubkey))
+        known = {name.lower() for name in snapshot.names.values()}
+        for name in self.client_files:
+            if name.lower() not in known:
+                docs[FILE_DOC_PREFIX + name] = (name, None, ())
+        return self.update(docs)
+
+    def search(self, query, limit=20):
+        """Возвращает до limit пар (doc_id, (имя, pubkey, ips)): сначала совпадения по префиксу, затем по подстроке"""
+        query = query.strip().lower()
+        if not query:
+            return []
+        with self.lock:
+            # Префиксные совпадения идут подряд в отсортированном списке, точное совпадение — первым
+            found = []
+            seen = set()
+            i = bisect.bisect_left(self.prefixes, (query,))
+            while len(found) < limit and i < len(self.prefixes) and self.prefixes[i][0].startswith(query):
+                doc_id = self.prefixes[i][1]
+                if doc_id not in seen:
+                    seen.add(doc_id)
+                    found.append(doc_id)
+                i += 1
+            if len(found) < limit and len(query) >= GRAM:
+                postings = sorted((self.grams.get(gram, ()) for gram in trigrams(query)), key=len)
+                candidates = postings[0].intersection(*postings[1:]) if postings[0] else ()
+                matches = [
+                    doc_id for doc_id in candidates
+                    if doc_id not in seen and any(query in field for field in self.fields[doc_id])
+                ]
+                found.extend(heapq.nsmallest(limit - len(found), matches, key=self._sort_key))
+            return [(doc_id, self.docs[doc_id]) for doc_id in found]
+
+    def _sort_key(self, doc_id):
+        return ((self.docs[doc_id][0] or '').lower(), doc_id)
@@ -0,0 +1,108 @@
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Сколько секунд снимок WireGuard считается свежим по умолчанию
+DEFAULT_TTL = 10
+
+
+class _Flight:
+    """Один выполняющийся запрос снимка, результат которого ждут все желающие"""
+
+    def __init__(self, generation):
+        self.generation = generation
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SnapshotCache:
+    """Общий кэш снимка WireGuard для обработчиков и мониторинга.
+
+    Одновременные запросы снимка схлопываются в один вызов fetch(). Если
+    снимок устарел, get() сразу возвращает старые данные и запускает
+    обновление в фоне; get_fresh() дожидается свежего снимка. invalidate()
+    увеличивает поколение кэша: результат запроса, начатого до сброса, не
+    сохраняется как текущий снимок и не отдаётся тем, кто пришёл после сброса.
+    """
+
+    def __init__(self, fetch, ttl=DEFAULT_TTL):
+        self.fetch = fetch
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.snapshot = None
+        # Последний полученный снимок (не сбрасывается invalidate(), нужен для расчёта скоростей)
+        self.latest = None
+        self.flight = None
+        # Увеличивается при каждом invalidate()
+        self.generation = 0
+
+    def seed(self, snapshot):
+        """Кладёт в кэш снимок, полученный в обход fetch() (например, при старте)"""
+        with self.lock:
+            if self.snapshot is None or snapshot.fetched_at > self.snapshot.fetched_at:
+                self.snapshot = snapshot
+                self.latest = snapshot
+
+    def invalidate(self):
+        """Сбрасывает снимок: следующий get() дождётся новых данных"""
+        with self.lock:
+            self.snapshot = None
+            self.generation += 1
+
+    def _fetch_shared(self):
+        with self.lock:
+            flight = self.flight
+            # К запросу, начатому до invalidate(), не присоединяемся — его данные устарели
+            leader = flight is None or flight.generation != self.generation
+            if leader:
+                flight = self.flight = _Flight(self.generation)
+        if leader:
+            try:
+                flight.result = self.fetch()
+                flight.result.derive_rates(self.latest)
+            except Exception as e:
+                flight.error = e
+            with self.lock:
+                if flight.result is not None and flight.generation == self.generation:
+                    self.snapshot = flight.result
+                    self.latest = flight.result
+                if self.flight is flight:
+                    self.flight = None
+            flight.done.set()
+        else:
+            flight.done.wait()
+        if flight.error is not None:
+            raise flight.error
+        return flight.result
+
+    def _refresh_in_background(self):
+        def refresh():
+            try:
+                self._fetch_shared()
+            except Exception as e:
+                logger.error(f"Ошибка фонового обновления снимка wg: {e}")
+
+        with self.lock:
+            if self.flight is not None:
+                return
+        threading.Thread(target=refresh, daemon=True).start()
+
+    def get(self):
+        """Возвращает снимок; устаревший отдаётся сразу, а обновление идёт в фоне"""
+        snapshot = self.snapshot
+        if snapshot is None:
+            return self._fetch_shared()
+        if snapshot.age() > self.ttl:
+            self._refresh_in_background()
+        return snapshot
+
+    def get_fresh(self, max_age=None):
+        """Возвращает снимок не старше max_age секунд (по умолчанию ttl), при необходимости ждёт"""
+        if max_age is None:
+            max_age = self.ttl
+        snapshot = self.snapshot
+        if snapshot is not None and snapshot.age() <= max_age:
+            return snapshot
+        return self._fetch_shared()
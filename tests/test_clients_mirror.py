@@ -0,0 +1,188 @@
+import hashlib
+import io
+import shutil
+import subprocess
+import tarfile
+
+import pytest
+
+from clients_mirror import SEPARATOR, ClientsMirror, SyncError
+
+
+def sha(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def manifest_lines(files, mtime=1700000000.5):
+    return b''.join(
+        f"{path}\t{len(data)}\t{mtime}\t{sha(data)}\n".encode() for path, data in files.items()
+    )
+
+
+def tar_of(files):
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode='w') as archive:
+        for path, data in files.items():
+            info = tarfile.TarInfo('./' + path)
+            info.size = len(data)
+            archive.addfile(info, io.BytesIO(data))
+    return buffer.getvalue()
+
+
+class FakeChannel:
+    def __init__(self, stdout, status=0, stderr=b''):
+        self.stdout = stdout
+        self.status = status
+        self.stderr = stderr
+        self.stdin = b''
+
+    def exec_command(self, command):
+        self.command = command
+
+    def sendall(self, data):
+        self.stdin += data
+
+    def shutdown_write(self):
+        pass
+
+    def recv_ready(self):
+        return bool(self.stdout)
+
+    def recv(self, size):
+        data, self.stdout = self.stdout[:size], self.stdout[size:]
+        return data
+
+    def recv_stderr_ready(self):
+        return bool(self.stderr)
+
+    def recv_stderr(self, size):
+        data, self.stderr = self.stderr[:size], self.stderr[size:]
+        return data
+
+    def exit_status_ready(self):
+        return True
+
+    def recv_exit_status(self):
+        return self.status
+
+    def close(self):
+        pass
+
+
+class ShellChannel(FakeChannel):
+    """Канал, выполняющий команду локальным bash вместо сервера"""
+
+    def __init__(self):
+        super().__init__(b'')
+
+    def shutdown_write(self):
+        result = subprocess.run(['bash', '-c', self.command], input=self.stdin, capture_output=True, timeout=60)
+        self.stdout, self.stderr, self.status = result.stdout, result.stderr, result.returncode
+
+
+class FakeClient:
+    def __init__(self, channel):
+        self.channel = channel
+
+    def get_transport(self):
+        return self
+
+    def open_session(self):
+        return self.channel
+
+
+def sync(mirror, remote, changed, status=0):
+    channel = FakeChannel(manifest_lines(remote) + SEPARATOR + (tar_of(changed) if changed else b''), status)
+    return mirror.sync(FakeClient(channel)), channel
+
+
+def test_read_manifest_stops_at_separator(tmp_path):
+    mirror = ClientsMirror(str(tmp_path))
+    stream = io.BytesIO(manifest_lines({'a.conf': b'A'}) + b'garbage line\n' + SEPARATOR + b'rest')
+    remote = mirror._read_manifest(stream)
+    assert remote == {'a.conf': {'size': 1, 'mtime': 1700000000.5, 'sha256': sha(b'A')}}
+    assert stream.read() == b'rest'
+
+
+def test_read_manifest_requires_separator(tmp_path):
+    mirror = ClientsMirror(str(tmp_path))
+    with pytest.raises(SyncError):
+        mirror._read_manifest(io.BytesIO(manifest_lines({'a.conf': b'A'})))
+
+
+def test_extract_verifies_hashes(tmp_path):
+    mirror = ClientsMirror(str(tmp_path))
+    remote = mirror._read_manifest(io.BytesIO(manifest_lines({'a.conf': b'A'}) + SEPARATOR))
+    with pytest.raises(SyncError):
+        mirror._extract(io.BytesIO(tar_of({'a.conf': b'tampered'})), remote)
+    assert mirror._extract(io.BytesIO(tar_of({'a.conf': b'A', 'unlisted.conf': b'X'})), remote) == {'a.conf'}
+    assert (tmp_path / 'a.conf').read_bytes() == b'A'
+    assert not (tmp_path / 'unlisted.conf').exists()
+
+
+def test_local_path_rejects_traversal(tmp_path):
+    mirror = ClientsMirror(str(tmp_path))
+    with pytest.raises(SyncError):
+        mirror.local_path('../outside.conf')
+
+
+def test_sync_reports_added_changed_removed(tmp_path):
+    mirror = ClientsMirror(str(tmp_path))
+    (added, changed, removed), _ = sync(mirror, {'a.conf': b'A', 'b.conf': b'B'}, {'a.conf': b'A', 'b.conf': b'B'})
+    assert (sorted(added), changed, removed) == (['a.conf', 'b.conf'], [], [])
+
+    remote = {'a.conf': b'A2', 'c.conf': b'C'}
+    (added, changed, removed), channel = sync(mirror, remote, remote)
+    assert (added, changed, removed) == (['c.conf'], ['a.conf'], ['b.conf'])
+    # Серверу передаётся локальный манифест, чтобы он прислал только изменившиеся файлы
+    assert f"{sha(b'B')}\tb.conf\n".encode() in channel.stdin
+    assert mirror.files() == ['a.conf', 'c.conf']
+    assert mirror.read_bytes('a.conf') == b'A2'
+    assert not (tmp_path / 'b.conf').exists()
+
+    # Манифест переживает перезапуск
+    assert ClientsMirror(str(tmp_path)).files() == ['a.conf', 'c.conf']
+
+
+def test_sync_fails_when_changed_file_is_missing(tmp_path):
+    mirror = ClientsMirror(str(tmp_path))
+    with pytest.raises(SyncError):
+        sync(mirror, {'a.conf': b'A'}, {})
+    assert mirror.files() == []
+
+
+def test_sync_fails_on_remote_error(tmp_path):
+    mirror = ClientsMirror(str(tmp_path))
+    with pytest.raises(SyncError):
+        sync(mirror, {}, {}, status=2)
+
+
+def test_sync_reads_stderr_alongside_stdout(tmp_path):
+    # stderr больше окна канала не должен останавливать чтение tar
+    mirror = ClientsMirror(str(tmp_path))
+    channel = FakeChannel(manifest_lines({'a.conf': b'A'}) + SEPARATOR + tar_of({'a.conf': b'A'}),
+                          status=1, stderr=b'warning\n' * 100000)
+    with pytest.raises(SyncError, match='warning'):
+        mirror.sync(FakeClient(channel))
+    assert channel.stdout == b''
+
+
+@pytest.mark.skipif(not all(shutil.which(tool) for tool in ('bash', 'find', 'sha256sum', 'tar')),
+                    reason="нужны bash, GNU find, sha256sum и tar")
+def test_sync_script_handles_long_file_list(tmp_path):
+    # Список имён больше 128 КиБ: xargs разбил бы его на несколько архивов
+    remote_dir = tmp_path / 'remote'
+    remote_dir.mkdir()
+    names = [f"client-{'x' * 40}-{i:05d}.conf" for i in range(3000)]
+    assert sum(len(name) + 1 for name in names) > 128 * 1024
+    for name in names:
+        (remote_dir / name).write_bytes(name.encode())
+    mirror = ClientsMirror(str(tmp_path / 'mirror'), remote_dir=str(remote_dir))
+
+    added, changed, removed = mirror.sync(FakeClient(ShellChannel()))
+    assert (len(added), changed, removed) == (len(names), [], [])
+    assert mirror.read_bytes(names[-1]) == names[-1].encode()
+
+    # Повторная синхронизация не передаёт неизменившиеся файлы
+    (remote_dir / names[0]).write_bytes(b'changed')
+    assert mirror.sync(FakeClient(ShellChannel())) == ([], [names[0]], [])
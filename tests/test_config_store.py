@@ -0,0 +1,74 @@
+import pytest
+
+from config_store import ConfigStore, chunk_items, split_blocks
+
+WG0 = b"""[Interface]
+Address = 10.0.0.1/24
+PrivateKey = server
+
+# Client: alice
+[Peer]
+PublicKey = A
+AllowedIPs = 10.0.0.2/32
+
+[Peer]
+# Client: bob
+PublicKey = B
+AllowedIPs = 10.0.0.3/32
+"""
+
+
+def wg0_with(count):
+    lines = [b"[Interface]\nPrivateKey = server\n"]
+    for i in range(count):
+        lines.append(b"# Client: c%d\n[Peer]\nPublicKey = key%d\nAllowedIPs = 10.0.%d.%d/32\n\n" % (i, i, i // 250, i % 250))
+    return b''.join(lines)
+
+
+def test_split_blocks_round_trip_and_client_comments():
+    blocks = split_blocks(WG0)
+    assert b''.join(blocks) == WG0
+    assert len(blocks) == 3
+    # Комментарий `# Client:` остаётся в блоке своего пира — и над заголовком, и под ним
+    assert blocks[1].startswith(b"# Client: alice\n[Peer]")
+    assert blocks[2].startswith(b"[Peer]\n# Client: bob")
+
+
+def test_chunk_items_boundaries_are_content_defined():
+    items = [b"%d" % i for i in range(500)]
+    chunks = chunk_items(items)
+    assert [item for chunk in chunks for item in chunk] == items
+    # Удаление элемента меняет только кусок, в котором он был
+    edited = chunk_items(items[:250] + items[251:])
+    assert len(set(map(tuple, chunks)) ^ set(map(tuple, edited))) <= 3
+
+
+def test_commit_checkout_round_trip(tmp_path):
+    store = ConfigStore(str(tmp_path / 'revisions.sqlite3'))
+    files = {'/etc/wireguard/wg0.conf': WG0, '/etc/wireguard/clients/alice.conf': b'client', '/empty': b''}
+    revision_id, created = store.commit(files, 'первая')
+    assert created
+    assert store.checkout(revision_id) == files
+    # Такое же состояние новую ревизию не создаёт
+    assert store.commit(files, 'повтор') == (revision_id, False)
+    second, created = store.commit({'/etc/wireguard/wg0.conf': WG0}, 'без клиента')
+    assert created and second > revision_id
+    assert store.checkout(second) == {'/etc/wireguard/wg0.conf': WG0}
+    assert [(rid, reason) for rid, _, reason in store.revisions()] == [(second, 'без клиента'), (revision_id, 'первая')]
+    with pytest.raises(KeyError):
+        store.checkout(second + 1)
+
+
+def test_deleting_one_peer_adds_few_objects(tmp_path):
+    store = ConfigStore(str(tmp_path / 'revisions.sqlite3'))
+    before = wg0_with(1000)
+    store.commit({'/etc/wireguard/wg0.conf': before})
+    _, objects, size = store.stats()
+    blocks = split_blocks(before)
+    after = b''.join(blocks[:500] + blocks[501:])
+    revision_id, _ = store.commit({'/etc/wireguard/wg0.conf': after})
+    _, objects_after, size_after = store.stats()
+    assert store.checkout(revision_id) == {'/etc/wireguard/wg0.conf': after}
+    # Новые объекты — только изменившиеся куски списков и манифест, блоки не дублируются
+    assert objects_after - objects < 10
+    assert size_after - size < size // 10
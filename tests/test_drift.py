@@ -0,0 +1,113 @@
+from drift import DriftDetector, build_report, normalize_ips
+from wg_show import WgSnapshot
+
+WG0 = """[Interface]
+PrivateKey = server
+# Client: alice
+[Peer]
+PublicKey = A
+AllowedIPs = 10.0.0.2
+# Client: carol
+[Peer]
+PublicKey = C
+AllowedIPs = 10.0.0.3/32
+# Client: dave
+[Peer]
+PublicKey = D
+AllowedIPs = 10.0.0.4/32
+""".splitlines(keepends=True)
+
+
+def live(*peers):
+    rows = [{'interface': 'wg0', 'public key': 'S', 'listening port': '51820'}]
+    for pubkey, ips in peers:
+        rows.append({'interface': 'wg0', 'peer': pubkey, 'allowed ips': ips, 'handshake_ts': 0})
+    return rows
+
+
+LIVE = live(('A', '10.0.0.2/32'), ('B', '10.0.0.9/32'), ('D', '10.0.0.5/32'))
+
+
+def test_normalize_ips():
+    assert normalize_ips('10.0.0.2, 10.0.0.3/32') == normalize_ips('10.0.0.3/32,10.0.0.2/32')
+    assert normalize_ips('(none)') == frozenset()
+
+
+def test_build_report_set_differences():
+    report = build_report(WgSnapshot(LIVE, WG0), ['alice.conf', 'zed.conf', 'notes.txt'])
+    assert report.config_only == {'C'}
+    assert report.live_only == {'B'}
+    assert report.ips_mismatch == {'D'}
+    assert report.orphan_files == {'zed'}
+    assert report.missing_files == {'carol', 'dave'}
+    assert report.interface_drift and report.can_remove_files
+
+
+def test_build_report_in_sync():
+    snapshot = WgSnapshot(live(('A', '10.0.0.2/32'), ('C', '10.0.0.3/32'), ('D', '10.0.0.4/32')), WG0)
+    report = build_report(snapshot, ['alice.conf', 'carol.conf', 'dave.conf'])
+    assert not report
+    assert not report.interface_drift and not report.can_remove_files
+
+
+def test_unread_wg0_is_not_drift():
+    """wg0.conf не прочитан — это не повод считать все пиры и файлы лишними"""
+    report = build_report(WgSnapshot(LIVE, None), ['alice.conf', 'zed.conf'])
+    assert not report
+    assert not report.config_checked
+    assert not report.interface_drift and not report.can_remove_files
+
+
+def test_readable_empty_wg0_is_drift():
+    report = build_report(WgSnapshot(LIVE, []), ['alice.conf'])
+    assert report.config_checked
+    assert report.live_only == {'A', 'B', 'D'}
+    assert report.orphan_files == {'alice'}
+
+
+def test_failed_file_list_skips_file_checks():
+    report = build_report(WgSnapshot(LIVE, WG0), None)
+    assert not report.files_checked
+    assert report.orphan_files == frozenset() and report.missing_files == frozenset()
+    assert report.live_only == {'B'}
+    assert not report.can_remove_files
+
+
+def test_observe_alerts_once_after_two_ticks():
+    detector = DriftDetector()
+    files = ['alice.conf', 'zed.conf']
+    assert detector.observe(WgSnapshot(LIVE, WG0), files) is None
+    report = detector.observe(WgSnapshot(LIVE, WG0), files)
+    assert report is not None and report.live_only == {'B'}
+    assert detector.observe(WgSnapshot(LIVE, WG0), files) is None
+
+
+def test_observe_ignores_one_tick_glitch():
+    detector = DriftDetector()
+    clean = live(('A', '10.0.0.2/32'), ('C', '10.0.0.3/32'), ('D', '10.0.0.4/32'))
+    files = ['alice.conf', 'carol.conf', 'dave.conf']
+    assert detector.observe(WgSnapshot(clean, WG0), files) is None
+    assert detector.observe(WgSnapshot(LIVE, WG0), files) is None
+    assert detector.observe(WgSnapshot(clean, WG0), files) is None
+    assert detector.observe(WgSnapshot(clean, WG0), files) is None
+
+
+def test_failed_sources_keep_previous_report():
+    detector = DriftDetector()
+    files = ['alice.conf', 'zed.conf']
+    detector.observe(WgSnapshot(LIVE, WG0), files)
+    assert detector.observe(WgSnapshot(LIVE, WG0), files) is not None
+    # Ни сбой чтения wg0.conf, ни сбой списка файлов не дают оповещения «расхождения исчезли»
+    for snapshot, client_files in ((WgSnapshot(LIVE, None), files), (WgSnapshot(LIVE, WG0), None)) * 2:
+        assert detector.observe(snapshot, client_files) is None
+    report = detector.check(WgSnapshot(LIVE, None), None)
+    assert report.live_only == {'B'} and report.orphan_files == {'zed'}
+    assert not report.interface_drift and not report.can_remove_files
+
+
+def test_acknowledge_suppresses_alert():
+    detector = DriftDetector()
+    report = detector.check(WgSnapshot(LIVE, WG0), ['alice.conf'])
+    detector.acknowledge(report)
+    assert detector.observe(WgSnapshot(LIVE, WG0), ['alice.conf']) is None
+    assert detector.observe(WgSnapshot(LIVE, WG0), ['alice.conf']) is None
@@ -0,0 +1,40 @@
+from traffic_accounting import TrafficAccounting
+from wg_show import WgSnapshot
+
+
+def snapshot(**counters):
+    rows = [{'interface': 'wg0', 'public key': 'S', 'listening port': '51820'}]
+    for pubkey, (rx, tx) in counters.items():
+        rows.append({'interface': 'wg0', 'peer': pubkey, 'rx_bytes': rx, 'tx_bytes': tx})
+    return WgSnapshot(rows)
+
+
+def test_first_snapshot_only_sets_baseline(tmp_path):
+    accounting = TrafficAccounting(str(tmp_path / 'traffic.sqlite3'))
+    assert accounting.record_snapshot(snapshot(A=(1000, 500))) == 0
+    assert accounting.get_totals('A')['total'] == (0, 0)
+    accounting.record_snapshot(snapshot(A=(1300, 700)))
+    assert accounting.get_totals('A')['total'] == (300, 200)
+
+
+def test_counter_decrease_counts_from_zero(tmp_path):
+    accounting = TrafficAccounting(str(tmp_path / 'traffic.sqlite3'))
+    accounting.record_snapshot(snapshot(A=(1000, 500)))
+    accounting.record_snapshot(snapshot(A=(40, 10)))
+    assert accounting.get_totals('A')['total'] == (40, 10)
+
+
+def test_checkpointed_restart_counts_traffic_above_old_baseline(tmp_path):
+    path = str(tmp_path / 'traffic.sqlite3')
+    accounting = TrafficAccounting(path)
+    accounting.record_snapshot(snapshot(A=(1000, 500)))
+    # Учёт перед перезапуском, затем обнуление баз
+    accounting.record_snapshot(snapshot(A=(1100, 600)))
+    accounting.reset_baselines(['A'])
+    # К опросу после перезапуска счётчик успел превысить прежнее значение
+    accounting.record_snapshot(snapshot(A=(1500, 900)))
+    assert accounting.get_totals('A')['total'] == (100 + 1500, 100 + 900)
+
+    # Обнулённые базы сохраняются в БД
+    accounting.reset_baselines(['A'])
+    assert TrafficAccounting(path).last['A'] == (0, 0)
@@ -0,0 +1,196 @@
+import asyncio
+import json
+
+import pytest
+
+import webhook
+from webhook import HTTPError, WebhookServer, parse_request
+
+SECRET = 'test-secret'
+PATH = '/tg/hook'
+
+
+def post(update_id, secret=SECRET, path=PATH, extra=''):
+    body = json.dumps({'update_id': update_id}).encode()
+    head = (
+        f"POST {path} HTTP/1.1\r\nHost: localhost\r\nContent-Type: application/json\r\n"
+        f"X-Telegram-Bot-Api-Secret-Token: {secret}\r\nContent-Length: {len(body)}\r\n{extra}\r\n"
+    )
+    return head.encode() + body
+
+
+def chunked_post(update_id):
+    body = json.dumps({'update_id': update_id}).encode()
+    head = (
+        f"POST {PATH} HTTP/1.1\r\nX-Telegram-Bot-Api-Secret-Token: {SECRET}\r\n"
+        "Transfer-Encoding: chunked\r\n\r\n"
+    ).encode()
+    return head + b'%x\r\n%s\r\n%x;ext=1\r\n%s\r\n0\r\n\r\n' % (5, body[:5], len(body) - 5, body[5:])
+
+
+class FakeApplication:
+    def __init__(self):
+        self.bot = None
+        self.update_queue = asyncio.Queue()
+
+
+async def read_statuses(reader, count):
+    statuses = []
+    for _ in range(count):
+        status = (await reader.readline()).split()[1]
+        while (await reader.readline()) != b'\r\n':
+            pass
+        statuses.append(int(status))
+    return statuses
+
+
+def run_server(scenario, **settings):
+    async def main():
+        application = FakeApplication()
+        server = WebhookServer(application, PATH, SECRET, '127.0.0.1', 0)
+        for key, value in settings.items():
+            setattr(server, key, value)
+        await server.start()
+        port = server.server.sockets[0].getsockname()[1]
+        try:
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            result = await scenario(reader, writer)
+            writer.close()
+            return result, application
+        finally:
+            await server.stop()
+
+    return asyncio.run(main())
+
+
+def test_parse_request_content_length():
+    data = bytearray(post(1) + b'GET')
+    (method, target, version, headers, body), end = parse_request(data)
+    assert (method, target, version) == ('POST', PATH, 'HTTP/1.1')
+    assert headers[webhook.SECRET_HEADER] == SECRET
+    assert json.loads(body) == {'update_id': 1}
+    assert data[end:] == b'GET'
+
+
+def test_parse_request_incomplete_and_chunked():
+    full = chunked_post(7)
+    for cut in (10, len(full) - 3):
+        assert parse_request(bytearray(full[:cut])) is None
+    (_, _, _, _, body), end = parse_request(bytearray(full))
+    assert json.loads(body) == {'update_id': 7}
+    assert end == len(full)
+
+
+def test_parse_request_limits():
+    with pytest.raises(HTTPError) as error:
+        parse_request(bytearray(post(1)), max_body=5)
+    assert error.value.status == 413
+    with pytest.raises(HTTPError) as error:
+        parse_request(bytearray(b'X' * (webhook.MAX_HEADER_BYTES + 1)))
+    assert error.value.status == 431
+    with pytest.raises(HTTPError) as error:
+        parse_request(bytearray(b'POST / HTTP/1.1\r\nTransfer-Encoding: gzip\r\n\r\n'))
+    assert error.value.status == 501
+
+
+def test_pipelined_requests_are_acknowledged_in_one_batch():
+    async def scenario(reader, writer):
+        writer.write(post(1) + post(2, secret='wrong') + chunked_post(3) + post(4, path='/other'))
+        await writer.drain()
+        return await read_statuses(reader, 4)
+
+    statuses, application = run_server(scenario)
+    assert statuses == [200, 403, 200, 404]
+    queued = [application.update_queue.get_nowait().update_id for _ in range(application.update_queue.qsize())]
+    assert queued == [1, 3]
+
+
+def test_incomplete_request_times_out():
+    async def scenario(reader, writer):
+        writer.write(post(1)[:20])
+        await writer.drain()
+        # Сервер закрывает соединение, не дождавшись конца заголовков
+        return await asyncio.wait_for(reader.read(), 2)
+
+    closed, application = run_server(scenario, request_timeout=0.2)
+    assert closed == b''
+    assert application.update_queue.empty()
+
+
+def test_serve_against_fake_bot_api():
+    """serve() регистрирует вебхук через локальный поддельный Bot API и доставляет обновления обработчикам"""
+    from telegram import Update
+    from telegram.ext import Application, MessageHandler, filters
+
+    async def main():
+        calls = []
+
+        async def fake_api(reader, writer):
+            head = await reader.readuntil(b'\r\n\r\n')
+            request_line, *lines = head.decode().split('\r\n')
+            length = next((int(line.split(':')[1]) for line in lines if line.lower().startswith('content-length')), 0)
+            await reader.readexactly(length)
+            method = request_line.split()[1].rsplit('/', 1)[-1]
+            calls.append(method)
+            result = {'id': 1, 'is_bot': True, 'first_name': 'bot', 'username': 'bot'} if method == 'getMe' else True
+            body = json.dumps({'ok': True, 'result': result}).encode()
+            writer.write(
+                b'HTTP/1.1 200 OK\r\nContent-Type: application/json\r\nConnection: close\r\n'
+                b'Content-Length: %d\r\n\r\n%s' % (len(body), body)
+            )
+            await writer.drain()
+            writer.close()
+
+        api = await asyncio.start_server(fake_api, '127.0.0.1', 0)
+        api_port = api.sockets[0].getsockname()[1]
+        received = asyncio.Event()
+        texts = []
+
+        async def on_message(update, context):
+            texts.append(update.message.text)
+            received.set()
+
+        application = (
+            Application.builder().token('1:test').base_url(f"http://127.0.0.1:{api_port}/bot").updater(None).build()
+        )
+        application.add_handler(MessageHandler(filters.TEXT, on_message))
+        probe = await asyncio.start_server(lambda r, w: None, '127.0.0.1', 0)
+        port = probe.sockets[0].getsockname()[1]
+        probe.close()
+        await probe.wait_closed()
+        settings = {
+            'url': f"https://example.org{PATH}", 'listen': '127.0.0.1', 'port': port,
+            'secret_token': SECRET, 'max_connections': 40,
+        }
+        task = asyncio.create_task(webhook.serve(application, settings, Update.ALL_TYPES))
+        try:
+            for _ in range(100):
+                if 'setWebhook' in calls:
+                    break
+                await asyncio.sleep(0.02)
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            message = {
+                'update_id': 10,
+                'message': {'message_id': 1, 'date': 0, 'chat': {'id': 5, 'type': 'private'}, 'text': 'hi'},
+            }
+            body = json.dumps(message).encode()
+            writer.write(
+                f"POST {PATH} HTTP/1.1\r\nX-Telegram-Bot-Api-Secret-Token: {SECRET}\r\n"
+                f"Content-Length: {len(body)}\r\n\r\n".encode() + body
+            )
+            await writer.drain()
+            statuses = await read_statuses(reader, 1)
+            await asyncio.wait_for(received.wait(), 5)
+            writer.close()
+        finally:
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+            api.close()
+            await api.wait_closed()
+        return calls, statuses, texts
+
+    calls, statuses, texts = asyncio.run(main())
+    assert calls[:2] == ['getMe', 'setWebhook']
+    assert statuses == [200]
+    assert texts == ['hi']
@@ -0,0 +1,126 @@
+import sqlite3
+import threading
+import time
+
+DEFAULT_TRAFFIC_PATH = 'wg_traffic.sqlite3'
+LIFETIME = 'total'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS counters (
+    pubkey TEXT PRIMARY KEY,
+    rx INTEGER NOT NULL,
+    tx INTEGER NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS totals (
+    pubkey TEXT NOT NULL,
+    period TEXT NOT NULL,
+    rx INTEGER NOT NULL,
+    tx INTEGER NOT NULL,
+    PRIMARY KEY (pubkey, period)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS totals_period ON totals (period);
+"""
+
+
+def month_of(timestamp):
+    return time.strftime('%Y-%m', time.localtime(timestamp))
+
+
+class TrafficAccounting:
+    """Накопительный учёт трафика пиров, переживающий сброс счётчиков.
+
+    `wg-quick down/up` обнуляет счётчики transfer, поэтому на каждом опросе
+    считается прирост относительно прошлых значений: если счётчик
+    уменьшился, интерфейс перезапускался и прирост равен текущему значению.
+    Пир, увиденный впервые, только задаёт базу: трафик, накопленный его
+    счётчиком до начала учёта, ни к какому месяцу не относится.
+    Приросты добавляются к итогам за всё время и за текущий месяц, итоги
+    никогда не пересчитываются из сырых данных.
+    """
+
+    def __init__(self, path=DEFAULT_TRAFFIC_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode = WAL")
+        self.db.executescript(SCHEMA)
+        self.last = {pubkey: (rx, tx) for pubkey, rx, tx in self.db.execute("SELECT pubkey, rx, tx FROM counters")}
+        self.month = month_of(time.time())
+        self.totals = {}
+        self._load_totals()
+
+    def _load_totals(self):
+        self.totals = {
+            (pubkey, period): [rx, tx]
+            for pubkey, period, rx, tx in self.db.execute(
+                "SELECT pubkey, period, rx, tx FROM totals WHERE period IN (?, ?)", (LIFETIME, self.month)
+            )
+        }
+
+    def record_snapshot(self, snapshot):
+        """Добавляет приросты счётчиков из снимка к итогам одной транзакцией"""
+        month = month_of(snapshot.taken_at)
+        counters = []
+        increments = []
+        with self.lock, self.db:
+            if month != self.month:
+                self.month = month
+                self._load_totals()
+            for pubkey, peer in snapshot.by_key.items():
+                rx = peer.get('rx_bytes', 0)
+                tx = peer.get('tx_bytes', 0)
+                if pubkey not in self.last:
+                    counters.append((pubkey, rx, tx))
+                    self.last[pubkey] = (rx, tx)
+                    continue
+                last_rx, last_tx = self.last[pubkey]
+                # Счётчик уменьшился — был сброс, считаем с нуля
+                delta_rx = rx - last_rx if rx >= last_rx else rx
+                delta_tx = tx - last_tx if tx >= last_tx else tx
+                if (rx, tx) != (last_rx, last_tx):
+                    counters.append((pubkey, rx, tx))
+                    self.last[pubkey] = (rx, tx)
+                if not delta_rx and not delta_tx:
+                    continue
+                for period in (LIFETIME, month):
+                    increments.append((pubkey, period, delta_rx, delta_tx))
+                    total = self.totals.setdefault((pubkey, period), [0, 0])
+                    total[0] += delta_rx
+                    total[1] += delta_tx
+            if counters:
+                self.db.executemany("INSERT OR REPLACE INTO counters (pubkey, rx, tx) VALUES (?, ?, ?)", counters)
+            if increments:
+                self.db.executemany(
+                    "INSERT INTO totals (pubkey, period, rx, tx) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT (pubkey, period) DO UPDATE SET rx = rx + excluded.rx, tx = tx + excluded.tx",
+                    increments
+                )
+        return len(increments) // 2
+
+    def reset_baselines(self, pubkeys):
+        """Обнуляет базы пиров после перезапуска интерфейса, учтённого перед ним через record_snapshot.
+
+        Иначе прирост после перезапуска считался бы от прежних значений и
+        терялся, пока счётчик не догонит их к следующему опросу.
+        """
+        counters = [(pubkey, 0, 0) for pubkey in pubkeys]
+        with self.lock, self.db:
+            for pubkey, rx, tx in counters:
+                self.last[pubkey] = (rx, tx)
+            if counters:
+                self.db.executemany("INSERT OR REPLACE INTO counters (pubkey, rx, tx) VALUES (?, ?, ?)", counters)
+
+    def get_totals(self, pubkey):
+        """Возвращает {'total': (rx, tx), 'month': (rx, tx)} для пира"""
+        with self.lock:
+            total = self.totals.get((pubkey, LIFETIME), (0, 0))
+            month = self.totals.get((pubkey, self.month), (0, 0))
+        return {'total': tuple(total), 'month': tuple(month)}
+
+    def period_report(self, period=None):
+        """Итоги по пирам за месяц YYYY-MM (по умолчанию текущий), по убыванию трафика"""
+        with self.lock:
+            return self.db.execute(
+                "SELECT pubkey, rx, tx FROM totals WHERE period = ? ORDER BY rx + tx DESC",
+                (period or self.month,)
+            ).fetchall()
@@ -0,0 +1,167 @@
+import html
+import time
+
+from history import EVENT_NAMES, PEER_DELETED
+from wg_show import format_bytes
+
+# Telegram ограничивает размер inline-клавиатуры, поэтому кнопки есть только у первых пиров
+MAX_PEER_BUTTONS = 90
+
+
+def format_rate(bytes_per_second):
+    return f"{format_bytes(int(bytes_per_second))}/s"
+
+
+def peer_button_label(snapshot, pubkey):
+    return snapshot.names.get(pubkey) or f"{pubkey[:10]}…"
+
+
+def format_totals(totals):
+    rx, tx = totals
+    return f"⬇️ {format_bytes(rx)}, ⬆️ {format_bytes(tx)}"
+
+
+def render_peer_details(snapshot, pubkey, totals=None, location=None):
+    """HTML-карточка пира для Telegram по данным снимка"""
+    peer = snapshot.by_key.get(pubkey)
+    name = snapshot.names.get(pubkey)
+    message = "🔎 <b>Клиент WireGuard</b>\n\n"
+    if name:
+        message += f"📝 <b>Имя:</b> {html.escape(name)}\n"
+    message += f"🔑 <b>Публичный ключ:</b> <code>{pubkey}</code>\n"
+    if peer is None:
+        message += "⚪️ Пир есть в wg0.conf, но не загружен в интерфейс\n"
+    else:
+        message += f"🖧 <b>Интерфейс:</b> {html.escape(peer.get('interface', ''))}\n"
+        message += f"🌐 <b>Разрешенные IP:</b> {html.escape(peer.get('allowed ips', 'Нет данных'))}\n"
+        message += f"📍 <b>Endpoint:</b> {html.escape(peer.get('endpoint', 'Нет данных'))}\n"
+        if location:
+            message += f"🌍 <b>Локация:</b> {html.escape(location)}\n"
+        message += f"📡 <b>Последний handshake:</b> {peer.get('latest handshake', 'Нет данных')}\n"
+        message += f"📊 <b>Трафик:</b> {peer.get('transfer', 'Нет данных')}\n"
+        rates = snapshot.rates.get(pubkey)
+        if rates:
+            message += f"⚡️ <b>Скорость:</b> ⬇️ {format_rate(rates[0])}, ⬆️ {format_rate(rates[1])}\n"
+    if totals:
+        message += f"📦 <b>За месяц:</b> {format_totals(totals['month'])}\n"
+        message += f"📦 <b>Всего:</b> {format_totals(totals['total'])}\n"
+    block = snapshot.config_block(pubkey)
+    if block:
+        shown = [
+            line.split('=', 1)[0] + '= (hidden)' if line.strip().startswith('PresharedKey') else line
+            for line in block
+        ]
+        message += f"\n<b>Блок в wg0.conf:</b>\n<pre>{html.escape(chr(10).join(shown))}</pre>"
+    return message
+
+
+def render_traffic_report(period, rows, names):
+    """HTML-отчёт по трафику клиентов за месяц для команды /traffic"""
+    if not rows:
+        return f"📦 Нет данных о трафике за {html.escape(period)}."
+    message = f"📦 <b>Трафик за {html.escape(period)}:</b>\n\n"
+    for i, (pubkey, rx, tx) in enumerate(rows, 1):
+        label = html.escape(names.get(pubkey) or f"{pubkey[:20]}...")
+        message += f"{i}. <b>{label}</b> — {format_totals((rx, tx))}\n"
+    return message
+
+
+def render_history(query, events):
+    """HTML-список событий пира для команды /history"""
+    if not events:
+        return f"📜 Нет событий для {html.escape(query)}."
+    message = f"📜 <b>История {html.escape(query)}:</b>\n\n"
+    for ts, kind, detail in events:
+        stamp = time.strftime('%Y-%m-%d %H:%M', time.localtime(ts))
+        message += f"<code>{stamp}</code> {EVENT_NAMES.get(kind, kind)}"
+        if detail and kind != PEER_DELETED:
+            message += f" <i>{html.escape(detail)}</i>"
+        message += "\n"
+    return message
+
+
+def describe_search_result(doc):
+    """Короткое описание найденного клиента: ключ и туннельные IP"""
+    name, pubkey, ips = doc
+    parts = [f"{pubkey[:16]}…" if pubkey else "только файл в clients/"]
+    if ips:
+        parts.append(', '.join(ips))
+    return ' · '.join(parts)
+
+
+def render_search_results(query, results):
+    """HTML-список найденных клиентов для команды /find"""
+    if not results:
+        return f"🔍 Ничего не найдено по запросу {html.escape(query)}."
+    message = f"🔍 <b>Найдено по запросу {html.escape(query)}:</b>\n\n"
+    for i, (_, (name, pubkey, ips)) in enumerate(results, 1):
+        message += f"{i}. <b>{html.escape(name) if name else 'Без имени'}</b>\n"
+        if pubkey:
+            message += f"   🔑 <code>{pubkey}</code>\n"
+        else:
+            message += "   📄 Есть файл в clients/, но нет пира в wg0.conf\n"
+        if ips:
+            message += f"   🌐 {html.escape(', '.join(ips))}\n"
+    return message
+
+
+def render_revisions(revisions, stats):
+    """HTML-список последних ревизий конфигурации для команды /rollback"""
+    count, objects, size = stats
+    if not revisions:
+        return "🗂 Ревизий конфигурации пока нет — они сохраняются перед каждым изменением."
+    message = f"🗂 <b>Ревизии конфигурации</b> (всего {count}, {objects} объектов, {format_bytes(size)}):\n\n"
+    for revision_id, ts, reason in revisions:
+        stamp = time.strftime('%d.%m %H:%M', time.localtime(ts))
+        message += f"<b>#{revision_id}</b> <code>{stamp}</code> {html.escape(reason or '')}\n"
+    message += "\nНажмите на номер ревизии, чтобы вернуть её, или отправьте /rollback &lt;номер&gt;."
+    return message
+
+
+def _drift_items(items, describe, limit=15):
+    lines = [f"  • {describe(item)}" for item in sorted(items)[:limit]]
+    if len(items) > limit:
+        lines.append(f"  … и ещё {len(items) - limit}")
+    return '\n'.join(lines) + '\n'
+
+
+def render_drift(report, snapshot):
+    """HTML-отчёт о расхождениях wg0.conf, интерфейса и каталога clients/ для /drift и оповещений"""
+    def describe_key(pubkey):
+        name = snapshot.names.get(pubkey)
+        key = f"<code>{pubkey[:16]}…</code>"
+        return f"<b>{html.escape(name)}</b> {key}" if name else key
+
+    def describe_live(pubkey):
+        endpoint = snapshot.by_key.get(pubkey, {}).get('endpoint')
+        return describe_key(pubkey) + (f" ({html.escape(endpoint)})" if endpoint else '')
+
+    def describe_file(name):
+        return f"<code>{html.escape(name)}.conf</code>"
+
+    warnings = ''
+    if not report.config_checked:
+        warnings += "\n⚠️ wg0.conf прочитать не удалось — показаны расхождения последней успешной проверки, исправление недоступно.\n"
+    if not report.files_checked:
+        warnings += "\n⚠️ Список файлов clients/ получить не удалось, файлы не проверялись.\n"
+    if not report:
+        return "✅ <b>Расхождений нет:</b> wg0.conf, интерфейс и каталог clients/ совпадают.\n" + warnings
+    message = "⚠️ <b>Расхождения конфигурации WireGuard</b>\n\n"
+    if report.config_only:
+        message += f"📄 <b>Есть в wg0.conf, но не запущены на интерфейсе ({len(report.config_only)}):</b>\n"
+        message += _drift_items(report.config_only, describe_key)
+    if report.live_only:
+        message += f"🔌 <b>Работают на интерфейсе, но нет в wg0.conf ({len(report.live_only)}):</b>\n"
+        message += _drift_items(report.live_only, describe_live)
+    if report.ips_mismatch:
+        message += f"🌐 <b>AllowedIPs в wg0.conf и на интерфейсе различаются ({len(report.ips_mismatch)}):</b>\n"
+        message += _drift_items(report.ips_mismatch, describe_key)
+    if report.orphan_files:
+        message += f"🗂 <b>Файлы clients/ без пира в wg0.conf ({len(report.orphan_files)}):</b>\n"
+        message += _drift_items(report.orphan_files, describe_file)
+    if report.missing_files:
+        message += f"❓ <b>Клиенты из wg0.conf без файла в clients/ ({len(report.missing_files)}):</b>\n"
+        message += _drift_items(report.missing_files, html.escape)
+    if report.interface_drift:
+        message += "\n«Применить wg0.conf» приводит интерфейс к wg0.conf через <code>wg syncconf</code>: пиры, которых нет в wg0.conf, будут отключены.\n"
+    return message + warnings
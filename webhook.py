@@ -0,0 +1,300 @@
+import asyncio
+import hmac
+import json
+import logging
+import secrets
+from urllib.parse import urlsplit
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LISTEN = '127.0.0.1'
+DEFAULT_PORT = 8443
+# Сколько одновременных соединений Telegram может открыть к вебхуку
+DEFAULT_MAX_CONNECTIONS = 40
+SECRET_HEADER = 'x-telegram-bot-api-secret-token'
+# Обновления Telegram — небольшие JSON; всё крупнее отбрасываем не читая
+MAX_BODY_BYTES = 1024 * 1024
+# Сколько держим простаивающее keep-alive соединение
+IDLE_TIMEOUT = 75
+# За сколько начатый запрос (заголовки и тело) должен прийти целиком — защита от slowloris
+REQUEST_TIMEOUT = 10
+READ_CHUNK = 64 * 1024
+MAX_HEADER_BYTES = 16 * 1024
+
+REASONS = {
+    200: 'OK',
+    400: 'Bad Request',
+    403: 'Forbidden',
+    404: 'Not Found',
+    405: 'Method Not Allowed',
+    413: 'Payload Too Large',
+    431: 'Request Header Fields Too Large',
+    501: 'Not Implemented',
+}
+
+
+class HTTPError(Exception):
+    """Запрос разобрать нельзя; соединение закрывается после ответа с этим кодом"""
+
+    def __init__(self, status):
+        super().__init__(status)
+        self.status = status
+
+
+def parse_chunked(buffer, start, max_body):
+    """Разбирает тело в chunked-кодировке; возвращает (тело, конец) или None, если пришло не всё"""
+    body = bytearray()
+    pos = start
+    while True:
+        end = buffer.find(b'\r\n', pos)
+        if end < 0:
+            return None
+        try:
+            size = int(bytes(buffer[pos:end]).split(b';', 1)[0], 16)
+        except ValueError:
+            raise HTTPError(400)
+        pos = end + 2
+        if size == 0:
+            # Трейлеры не используются: пропускаем до пустой строки
+            while True:
+                end = buffer.find(b'\r\n', pos)
+                if end < 0:
+                    return None
+                if end == pos:
+                    return bytes(body), end + 2
+                pos = end + 2
+        if len(body) + size > max_body:
+            raise HTTPError(413)
+        if len(buffer) < pos + size + 2:
+            return None
+        body += buffer[pos:pos + size]
+        pos += size + 2
+
+
+def parse_request(buffer, max_body=MAX_BODY_BYTES):
+    """Разбирает один HTTP/1.1 запрос из начала буфера.
+
+    Возвращает ((метод, путь, версия, заголовки, тело), число байт запроса)
+    или None, если запрос пришёл не целиком. Поддерживаются Content-Length
+    и Transfer-Encoding: chunked.
+    """
+    header_end = buffer.find(b'\r\n\r\n')
+    if header_end < 0:
+        if len(buffer) > MAX_HEADER_BYTES:
+            raise HTTPError(431)
+        return None
+    request_line, *header_lines = bytes(buffer[:header_end]).decode('latin-1').split('\r\n')
+    parts = request_line.split()
+    if len(parts) != 3:
+        raise HTTPError(400)
+    headers = {}
+    for line in header_lines:
+        key, _, value = line.partition(':')
+        headers[key.strip().lower()] = value.strip()
+    start = header_end + 4
+    encoding = headers.get('transfer-encoding', '').lower()
+    if encoding:
+        if encoding != 'chunked':
+            raise HTTPError(501)
+        parsed = parse_chunked(buffer, start, max_body)
+        if parsed is None:
+            return None
+        body, end = parsed
+    else:
+        try:
+            length = int(headers.get('content-length') or 0)
+        except ValueError:
+            raise HTTPError(400)
+        if length < 0:
+            raise HTTPError(400)
+        if length > max_body:
+            raise HTTPError(413)
+        if len(buffer) < start + length:
+            return None
+        body, end = bytes(buffer[start:start + length]), start + length
+    return (parts[0], parts[1], parts[2], headers, body), end
+
+
+def webhook_settings(config):
+    """Настройки вебхука из конфигурации или None, если WEBHOOK_URL не задан"""
+    url = config.get('WEBHOOK_URL')
+    if not url:
+        return None
+    return {
+        'url': url,
+        'listen': config.get('WEBHOOK_LISTEN', DEFAULT_LISTEN),
+        'port': config.get('WEBHOOK_PORT', DEFAULT_PORT),
+        # без заданного секрета генерируем новый при каждом запуске — он всё равно передаётся в setWebhook
+        'secret_token': config.get('WEBHOOK_SECRET') or secrets.token_urlsafe(32),
+        'max_connections': config.get('WEBHOOK_MAX_CONNECTIONS', DEFAULT_MAX_CONNECTIONS),
+    }
+
+
+class WebhookServer:
+    """Встроенный асинхронный HTTP сервер для приёма обновлений Telegram.
+
+    Работает на asyncio streams в цикле событий приложения, без отдельных
+    потоков и зависимостей. Запрос проверяется по пути и заголовку
+    X-Telegram-Bot-Api-Secret-Token, обновление кладётся в очередь
+    Application и подтверждается ответом 200, не дожидаясь обработчиков.
+    Подтверждения отправляются пачкой: все запросы, уже пришедшие по
+    соединению (в том числе конвейером, без ожидания ответа), разбираются из
+    буфера, их обновления ставятся в очередь, и ответы на них уходят одной
+    записью в сокет. Незаконченный запрос должен прийти целиком за
+    REQUEST_TIMEOUT, иначе соединение закрывается.
+    """
+
+    def __init__(self, application, url_path, secret_token, listen=DEFAULT_LISTEN, port=DEFAULT_PORT):
+        self.application = application
+        self.url_path = '/' + url_path.strip('/')
+        self.secret_token = secret_token.encode()
+        self.listen = listen
+        self.port = port
+        self.server = None
+        self.received = 0
+        self.request_timeout = REQUEST_TIMEOUT
+        self.max_body = MAX_BODY_BYTES
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle_connection, self.listen, self.port)
+        logger.info(f"Вебхук слушает {self.listen}:{self.port}{self.url_path}")
+
+    async def stop(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+
+    async def handle_connection(self, reader, writer):
+        loop = asyncio.get_running_loop()
+        buffer = bytearray()
+        # Время начала незаконченного запроса в буфере
+        started = None
+        try:
+            while True:
+                timeout = IDLE_TIMEOUT if started is None else started + self.request_timeout - loop.time()
+                try:
+                    data = await asyncio.wait_for(reader.read(READ_CHUNK), max(timeout, 0))
+                except asyncio.TimeoutError:
+                    break
+                if not data:
+                    break
+                buffer += data
+                if started is None:
+                    started = loop.time()
+                responses, keep_alive = await self.handle_buffer(buffer)
+                if responses:
+                    writer.write(b''.join(responses))
+                    await writer.drain()
+                    # Отсчёт таймаута — с начала следующего (ещё не законченного) запроса
+                    started = loop.time() if buffer else None
+                if not keep_alive:
+                    break
+        except ConnectionError as e:
+            logger.debug(f"Соединение вебхука прервано: {e}")
+        finally:
+            writer.close()
+
+    async def handle_buffer(self, buffer):
+        """Обрабатывает все целиком пришедшие запросы из буфера (разобранные удаляются).
+
+        Возвращает (ответы, держать ли соединение).
+        """
+        responses = []
+        updates = []
+        while buffer:
+            try:
+                parsed = parse_request(buffer, self.max_body)
+            except HTTPError as e:
+                responses.append(self.response(e.status, False))
+                keep_alive = False
+                break
+            if parsed is None:
+                keep_alive = True
+                break
+            (method, target, version, headers, body), end = parsed
+            del buffer[:end]
+            keep_alive = headers.get('connection', '').lower() != 'close' and version != 'HTTP/1.0'
+            status, data = self.check_request(method, target, headers, body)
+            if data is not None:
+                updates.append(data)
+            responses.append(self.response(status, keep_alive))
+            if not keep_alive:
+                break
+        else:
+            keep_alive = True
+        for data in updates:
+            await self.enqueue(data)
+        return responses, keep_alive
+
+    def check_request(self, method, target, headers, body):
+        """Проверяет запрос и возвращает (код ответа, данные обновления или None)"""
+        if target.split('?', 1)[0] != self.url_path:
+            return 404, None
+        if method != 'POST':
+            return 405, None
+        if not hmac.compare_digest(headers.get(SECRET_HEADER, '').encode(), self.secret_token):
+            logger.warning("Вебхук: запрос с неверным секретным токеном отклонён")
+            return 403, None
+        try:
+            return 200, json.loads(body)
+        except ValueError:
+            return 400, None
+
+    async def enqueue(self, data):
+        from telegram import Update
+        update = Update.de_json(data, self.application.bot)
+        if update is not None:
+            self.received += 1
+            await self.application.update_queue.put(update)
+
+    @staticmethod
+    def response(status, keep_alive):
+        return (
+            f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n"
+            f"Content-Length: 0\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+        ).encode('latin-1')
+
+
+async def serve(application, settings, allowed_updates=None):
+    """Запускает приложение в режиме вебхука; если вебхук поднять не удалось — в режиме polling.
+
+    Работает до отмены (Ctrl+C). Приложение инициализируется и
+    останавливается здесь же, поэтому вызывается через asyncio.run().
+    """
+    from telegram.error import TelegramError
+    async with application:
+        # Как run_polling/run_webhook: post_init вызывается после инициализации
+        if application.post_init:
+            await application.post_init(application)
+        await application.start()
+        server = WebhookServer(
+            application, urlsplit(settings['url']).path or '/', settings['secret_token'],
+            settings['listen'], settings['port']
+        )
+        polling = False
+        try:
+            await server.start()
+            await application.bot.set_webhook(
+                settings['url'],
+                secret_token=settings['secret_token'],
+                allowed_updates=allowed_updates,
+                max_connections=settings['max_connections'],
+            )
+            print(f"🌐 Вебхук {settings['url']} → {settings['listen']}:{settings['port']}")
+        except (OSError, TelegramError) as e:
+            logger.error(f"Не удалось включить вебхук, переходим на polling: {e}")
+            print(f"⚠️ Вебхук недоступен ({e}), используется polling")
+            await server.stop()
+            # start_polling сам снимает зарегистрированный вебхук
+            await application.updater.start_polling(allowed_updates=allowed_updates)
+            polling = True
+        try:
+            await asyncio.Event().wait()
+        finally:
+            if polling:
+                await application.updater.stop()
+            else:
+                await server.stop()
+            await application.stop()
@@ -0,0 +1,226 @@
+import time
+
+# Пир считается онлайн, если handshake был не позже этого количества секунд назад
+# (после 180 секунд без handshake WireGuard перестаёт принимать пакеты сессии)
+ONLINE_HANDSHAKE_SECONDS = 180
+
+WG_DUMP_COMMAND = "wg show all dump"
+
+
+def format_bytes(value):
+    """Форматирует количество байт так же, как это делает `wg show`"""
+    if value < 1024:
+        return f"{value} B"
+    for unit, power in (("KiB", 1), ("MiB", 2), ("GiB", 3)):
+        if value < 1024 ** (power + 1):
+            return f"{value / 1024 ** power:.2f} {unit}"
+    return f"{value / 1024 ** 4:.2f} TiB"
+
+
+def format_handshake_age(seconds):
+    """Форматирует возраст handshake так же, как это делает `wg show`"""
+    if seconds <= 0:
+        return "Now"
+    parts = []
+    for name, size in (("year", 365 * 24 * 3600), ("day", 24 * 3600), ("hour", 3600), ("minute", 60), ("second", 1)):
+        count, seconds = divmod(seconds, size)
+        if count:
+            parts.append(f"{count} {name}{'s' if count != 1 else ''}")
+    return ", ".join(parts) + " ago"
+
+
+def parse_wg_show(lines):
+    """Разбирает человекочитаемый вывод `wg show`, выдаёт словари пиров по одному"""
+    current_peer = None
+    for line in lines:
+        if line.startswith('peer:'):
+            if current_peer:
+                yield current_peer
+            current_peer = {'peer': line.split(':')[1].strip()}
+        elif current_peer and line.strip():
+            if ':' in line:
+                key, value = line.split(':', 1)
+                current_peer[key.strip()] = value.strip()
+    if current_peer:
+        yield current_peer
+
+
+def parse_wg_dump(lines, now=None):
+    """Разбирает вывод `wg show all dump`.
+
+    Выдаёт словари по одному на строку: для интерфейса — с ключами 'interface',
+    'public key', 'listening port'; для пира — с теми же ключами, что и
+    parse_wg_show ('peer', 'endpoint', 'allowed ips', 'latest handshake',
+    'transfer'), плюс числовые 'handshake_ts', 'rx_bytes', 'tx_bytes'.
+    """
+    if now is None:
+        now = int(time.time())
+    for line in lines:
+        fields = line.rstrip('\n').split('\t')
+        if len(fields) == 5:
+            interface, _private_key, public_key, listen_port, fwmark = fields
+            row = {'interface': interface, 'public key': public_key, 'listening port': listen_port}
+            if fwmark != 'off':
+                row['fwmark'] = fwmark
+            yield row
+        elif len(fields) == 9:
+            interface, public_key, _psk, endpoint, allowed_ips, handshake, rx, tx, keepalive = fields
+            handshake_ts = int(handshake)
+            rx_bytes = int(rx)
+            tx_bytes = int(tx)
+            peer = {
+                'interface': interface,
+                'peer': public_key,
+                'handshake_ts': handshake_ts,
+                'rx_bytes': rx_bytes,
+                'tx_bytes': tx_bytes,
+            }
+            if endpoint != '(none)':
+                peer['endpoint'] = endpoint
+            peer['allowed ips'] = allowed_ips
+            if handshake_ts:
+                peer['latest handshake'] = format_handshake_age(max(0, now - handshake_ts))
+            if rx_bytes or tx_bytes:
+                peer['transfer'] = f"{format_bytes(rx_bytes)} received, {format_bytes(tx_bytes)} sent"
+            if keepalive != 'off':
+                peer['persistent keepalive'] = f"every {keepalive} seconds"
+            yield peer
+
+
+def is_online(peer, now=None):
+    """Проверяет, был ли у пира недавний handshake"""
+    handshake_ts = peer.get('handshake_ts')
+    if not handshake_ts:
+        return False
+    if now is None:
+        now = time.time()
+    return now - handshake_ts <= ONLINE_HANDSHAKE_SECONDS
+
+
+def parse_wg0_names(lines):
+    """Возвращает словарь pubkey -> client_name по комментариям `# Client: ...` в wg0.conf"""
+    pubkey_to_name = {}
+    current_name = None
+    for line in lines:
+        l = line.strip()
+        if l.lower().startswith('# client:'):
+            current_name = l[9:].strip()
+        elif l.startswith('PublicKey'):
+            pubkey = l.split('=', 1)[-1].strip()
+            if current_name:
+                pubkey_to_name[pubkey] = current_name
+            current_name = None
+    return pubkey_to_name
+
+
+def parse_wg0_blocks(lines):
+    """Возвращает словарь pubkey -> строки блока [Peer] (вместе с комментарием `# Client:`)"""
+    blocks = {}
+    current = []
+    current_key = None
+    header = None
+    for line in lines:
+        l = line.strip()
+        if l.lower().startswith('# client:'):
+            starts_block = not (header == '[Peer]' and current_key is None)
+        elif l.startswith('['):
+            starts_block = header is not None
+        else:
+            starts_block = False
+        if starts_block:
+            if current_key:
+                blocks[current_key] = current
+            current = []
+            current_key = None
+            header = None
+        current.append(line.rstrip('\n'))
+        if l.startswith('['):
+            header = l
+        elif l.startswith('PublicKey'):
+            current_key = l.split('=', 1)[-1].strip()
+    if current_key:
+        blocks[current_key] = current
+    for key, block in blocks.items():
+        while block and not block[-1].strip():
+            block.pop()
+    return blocks
+
+
+class WgSnapshot:
+    """Снимок состояния WireGuard: `wg show all dump` + содержимое wg0.conf"""
+
+    def __init__(self, rows, wg0_lines=None):
+        self.interfaces = []
+        self.peers = []
+        for row in rows:
+            (self.peers if 'peer' in row else self.interfaces).append(row)
+        # False, если wg0.conf прочитать не удалось: пустой список пиров тогда ничего не значит
+        self.config_loaded = wg0_lines is not None
+        self.wg0_lines = wg0_lines or []
+        self.names = parse_wg0_names(self.wg0_lines)
+        self.fetched_at = time.monotonic()
+        self.taken_at = time.time()
+        # Индексы для поиска пира за O(1)
+        self.by_key = {peer['peer']: peer for peer in self.peers}
+        self.by_name = {name.lower(): pubkey for pubkey, name in self.names.items()}
+        self.rates = {}
+        self._blocks = None
+
+    def find_peer(self, query):
+        """Ищет пира по публичному ключу или имени клиента, возвращает pubkey или None"""
+        query = query.strip()
+        if query in self.by_key or query in self.names:
+            return query
+        return self.by_name.get(query.lower())
+
+    def config_blocks(self):
+        """Индекс pubkey -> строки блока [Peer] из wg0.conf (строится при первом обращении)"""
+        if self._blocks is None:
+            self._blocks = parse_wg0_blocks(self.wg0_lines)
+        return self._blocks
+
+    def config_block(self, pubkey):
+        """Строки блока пира из wg0.conf"""
+        return self.config_blocks().get(pubkey, [])
+
+    def derive_rates(self, previous):
+        """Считает скорости пиров (байт/с) относительно предыдущего снимка"""
+        if previous is None:
+            return
+        elapsed = self.fetched_at - previous.fetched_at
+        if elapsed <= 0:
+            return
+        for pubkey, peer in self.by_key.items():
+            old = previous.by_key.get(pubkey)
+            if old is None:
+                continue
+            rx = peer.get('rx_bytes', 0) - old.get('rx_bytes', 0)
+            tx = peer.get('tx_bytes', 0) - old.get('tx_bytes', 0)
+            # После перезапуска интерфейса счётчики обнуляются — скорость неизвестна
+            if rx >= 0 and tx >= 0:
+                self.rates[pubkey] = (rx / elapsed, tx / elapsed)
+
+    def age(self):
+        return time.monotonic() - self.fetched_at
+
+    def render_status(self):
+        """Текст статуса в том же виде, что и вывод `wg show`"""
+        blocks = []
+        for interface in self.interfaces:
+            lines = [f"interface: {interface['interface']}"]
+            lines.append(f"  public key: {interface['public key']}")
+            lines.append("  private key: (hidden)")
+            if interface.get('listening port') not in (None, '0'):
+                lines.append(f"  listening port: {interface['listening port']}")
+            if interface.get('fwmark'):
+                lines.append(f"  fwmark: {interface['fwmark']}")
+            blocks.append('\n'.join(lines))
+            for peer in self.peers:
+                if peer.get('interface') != interface['interface']:
+                    continue
+                lines = [f"peer: {peer['peer']}"]
+                for key in ('endpoint', 'allowed ips', 'latest handshake', 'transfer', 'persistent keepalive'):
+                    if peer.get(key):
+                        lines.append(f"  {key}: {peer[key]}")
+                blocks.append('\n'.join(lines))
+        return '\n\n'.join(blocks)
@@ -1,8 +1,10 @@
-import paramiko
 import re
 import json
 from datetime import datetime
 import os
+import perf
+from remote_exec import RemoteCommand
+from wg_show import parse_wg_dump, parse_wg_show
 
 class WireGuardManager:
     def __init__(self, ssh_host, ssh_port, ssh_username, ssh_password):
@@ -15,6 +17,7 @@ class WireGuardManager:
     def connect(self):
         """Устанавливает SSH соединение с сервером"""
         try:
+            import paramiko
             self.ssh_client = paramiko.SSHClient()
             self.ssh_client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
             self.ssh_client.connect(
@@ -42,42 +45,38 @@ class WireGuardManager:
                 
         try:
             if self.ssh_client:
-                stdin, stdout, stderr = self.ssh_client.exec_command(command)
-                output = stdout.read().decode('utf-8')
-                error = stderr.read().decode('utf-8')
-                return output, error
+                with perf.span('ssh_exec', command):
+                    return RemoteCommand(self.ssh_client, command).read()
             else:
                 return None, None
         except Exception as e:
             print(f"Ошибка выполнения команды: {e}")
             return None, None
             
+    def execute_command_lines(self, command):
+        """Выполняет команду на сервере и выдаёт строки вывода по мере поступления"""
+        if not self.ssh_client:
+            if not self.connect():
+                return
+                
+        yielded = False
+        try:
+            with perf.span('ssh_exec', command):
+                remote = RemoteCommand(self.ssh_client, command)
+                for line in remote.lines():
+                    yielded = True
+                    yield line
+            if remote.stderr:
+                print(f"Ошибка выполнения команды: {remote.stderr}")
+        except Exception as e:
+            # Оборванный вывод не выдаём за полный
+            print(f"Ошибка выполнения команды: {e}")
+            if yielded:
+                raise
+            
     def get_wg_configs(self):
         """Получает список всех конфигураций WireGuard"""
-        command = "wg show"
-        output, error = self.execute_command(command)
-        
-        if error or not output:
-            print(f"Ошибка получения конфигураций: {error}")
-            return []
-            
-        configs = []
-        current_peer = None
-        
-        for line in output.split('\n'):
-            if line.startswith('peer:'):
-                if current_peer:
-                    configs.append(current_peer)
-                current_peer = {'peer': line.split(':')[1].strip()}
-            elif current_peer and line.strip():
-                if ':' in line:
-                    key, value = line.split(':', 1)
-                    current_peer[key.strip()] = value.strip()
-                    
-        if current_peer:
-            configs.append(current_peer)
-            
-        return configs
+        return list(parse_wg_show(self.execute_command_lines("wg show")))
         
     def get_wg_interface_status(self):
         """Получает статус интерфейса WireGuard"""
@@ -89,26 +88,28 @@ class WireGuardManager:
             
         return output
         
-    def get_new_configs(self, last_check_time=None):
-        """Проверяет новые конфигурации с момента последней проверки"""
-        # Получаем список файлов конфигураций
-        command = "find /etc/wireguard/ -name '*.conf' -type f -newermt '{}' 2>/dev/null".format(
-            last_check_time.strftime('%Y-%m-%d %H:%M:%S') if last_check_time else '1 hour ago'
-        )
-        
-        output, error = self.execute_command(command)
-        
-        if error or not output:
-            print(f"Ошибка поиска новых конфигураций: {error}")
+    def get_new_configs(self, clients_mirror):
+        """Возвращает конфигурации клиентов, появившиеся или изменившиеся с прошлой синхронизации зеркала.
+
+        clients_mirror — зеркало бота (ClientsMirror): у одного каталога
+        зеркала должна быть одна блокировка.
+        """
+        if not self.ssh_client and not self.connect():
+            return []
+        try:
+            added, changed, _ = clients_mirror.sync(self.ssh_client)
+        except Exception as e:
+            print(f"Ошибка синхронизации каталога клиентов: {e}")
             return []
-            
         new_configs = []
-        for config_file in output.strip().split('\n'):
-            if config_file:
-                config_info = self.parse_config_file(config_file)
-                if config_info:
-                    new_configs.append(config_info)
-                    
+        for path in added + changed:
+            if path.endswith('.conf'):
+                config_info = self.parse_config_text(
+                    clients_mirror.read(path),
+                    f"{clients_mirror.remote_dir}/{path}",
+                    clients_mirror.manifest[path]['mtime']
+                )
+                new_configs.append(config_info)
         return new_configs
         
     def parse_config_file(self, config_path):
@@ -119,24 +120,29 @@ class WireGuardManager:
         if error or not output:
             return None
             
+        config_info = self.parse_config_text(output, config_path)
+        
+        # Получаем время создания файла
+        time_command = f"stat -c %y {config_path}"
+        time_output, _ = self.execute_command(time_command)
+        if time_output:
+            config_info['created_time'] = time_output.strip()
+            
+        return config_info
+        
+    def parse_config_text(self, text, config_path, mtime=None):
+        """Парсит содержимое конфигурации WireGuard"""
         config_info = {
             'filename': os.path.basename(config_path),
             'path': config_path,
-            'created_time': None,
+            'created_time': datetime.fromtimestamp(mtime).strftime('%Y-%m-%d %H:%M:%S') if mtime else None,
             'client_name': None,
             'public_key': None,
             'allowed_ips': None,
             'endpoint': None
         }
         
-        # Получаем время создания файла
-        time_command = f"stat -c %y {config_path}"
-        time_output, _ = self.execute_command(time_command)
-        if time_output:
-            config_info['created_time'] = time_output.strip()
-            
-        # Парсим содержимое конфигурации
-        for line in output.split('\n'):
+        for line in text.split('\n'):
             line = line.strip()
             if line.startswith('#') and 'name' in line.lower():
                 config_info['client_name'] = line.split('#')[1].strip()
@@ -151,19 +157,12 @@ class WireGuardManager:
         
     def get_client_stats(self, public_key):
         """Получает статистику клиента по публичному ключу"""
-        command = f"wg show | grep -A 10 'peer: {public_key}'"
-        output, error = self.execute_command(command)
-        
-        if error or not output:
-            return None
-            
-        stats = {}
-        for line in output.split('\n'):
-            if ':' in line:
-                key, value = line.split(':', 1)
-                stats[key.strip()] = value.strip()
-                
-        return stats 
+        # Фильтруем dump по точному совпадению ключа на сервере, чтобы не передавать весь интерфейс
+        command = f"wg show all dump | awk -F '\\t' -v key='{public_key}' '$2 == key'"
+        for stats in parse_wg_dump(self.execute_command_lines(command)):
+            if stats.get('peer') == public_key:
+                return stats
+        return None
 
     def read_remote_file(self, path):
         """Читает файл на сервере по SSH и возвращает список строк"""